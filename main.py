@@ -1,151 +1,54 @@
-from collections import Counter
-from datetime import datetime
+import argparse
+import base64
+from functools import partial
+import itertools
+import json
 import os
-from dataclasses import dataclass
+import sys
+import time
+from matplotlib.collections import LineCollection, PolyCollection
 import matplotlib.pyplot as plt
-import adif_io
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
 from utils.LocationUtil import LocationUtil
+from utils.LogbookUtil import LogbookUtil
+from utils.MapUtil import MapUtil
+from utils.QsoIndex import QsoIndex
+from utils.QsoTable import QsoTable
+from utils.RenderPipeline import RenderPipeline
+from utils.StatsUtil import StatsUtil
 from typing import Optional
 
 
-@dataclass
-class QsoEntity:
-    call: str
-    my_call: str
-    time_utc_on: datetime
-    time_utc_off: datetime
-    mode: str
-    band: str
-    name: str
-    sub_mode: Optional[str]
-    my_locator: str
-    locator: Optional[str]
-    freq: float
-    qsl_sent: bool
-    country: str
-    rst_rcvd: str
-    rst_sent: str
-    calc_distance: Optional[float]
-    calc_duration: float
+# Bump if a renderer changes (all outputs are rendered again)
+C_RENDER_VERSION = "1"
 
-    # def __str__(self):
-    #     return f"Call: {self.call}, My Call: {self.my_call}, Time On: {self.time_utc_on}, Time Off: {self.time_utc_off}, Mode: {self.mode}, Sub Mode: {self.sub_mode}, My Locator: {self.my_locator}, Locator: {self.locator}, Freq: {self.freq}, QSL Sent: {self.qsl_sent} Country: {self.country}, RST Rcvd: {self.rst_rcvd}, Name: {self.name}, Calc Distance: {self.calc_distance}, Calc Duration: {self.calc_duration} "
+# Callsign reports (ov_<name>.txt): name -> section title -> query (see QsoIndex, QSOs of any of a list of queries)
+C_CALL_REPORTS = {
+    "germany": {
+        "Club Stations Germany": {"country": "Federal Republic Of Germany", "regex": "^.[^J]0"},
+        # Special call with at least two digits or started with DP0
+        "Special Stations Germany": [{"country": "Federal Republic Of Germany", "regex": r"\d.*\d"},
+                                     {"prefix": "DP0"}],
+    },
+}
 
+# Grid map (qso_map_grid.html): QSOs per 4 and 6 character locator, 6 character cells from this zoom level on
+C_MAP_GRID_CHARS = [4, 6]
+C_MAP_GRID_DETAIL_ZOOM = 5
 
-def get_all_qsos(input_paths):
-    print(f"Found {len(input_paths)} ADIF files: ")
+# Static map (qso_map.png) of the "offline" map backend (the "mapbox" backend renders the tile map of the HTML map)
+C_MAP_BACKENDS = ["offline", "mapbox"]
+C_MAP_STATIC_COLORS = {"water": "#191a1a", "land": "#2f2f2f", "border": "#4a4a4a", "path": (1.0, 1.0, 1.0, 0.15)}
+C_MAP_STATIC_PATH_POINTS = 32
 
-    ret_qsos = []
-
-    for t_fp in input_paths:
-        t_qsos, _ = adif_io.read_from_file(C_WORK_DATA_DIR + "input/" + t_fp)
-        print(f" - '{t_fp}' with {len(t_qsos)} QSOs")
-        for t_qso in t_qsos:
-            ret_qsos.append(t_qso)
-
-    return ret_qsos
-
-
-def get_all_qsos_ent(input_qsos) -> [QsoEntity]:
-    ret_qsos: [QsoEntity] = []
-
-    for t_qso in input_qsos:
-
-        try:
-
-            # print(t_qso)
-            # raise Exception("Stop here")
-
-            calc_distance = None
-            if "gridsquare" in t_qso:
-                try:
-                    calc_distance = LocationUtil.calc_distance_azimuth(
-                        loc_0=LocationUtil.maidenhead_to_coordinates(t_qso["gridsquare"]),
-                        loc_1=LocationUtil.maidenhead_to_coordinates(t_qso["my_gridsquare"])
-                    )
-                    calc_distance = calc_distance.distance
-                    calc_distance = round(calc_distance, 2)
-                except Exception as e:
-                    print(f"- Warn by {str(t_qso).strip()}: {t_qso['gridsquare']}/{t_qso['call']}: {e}")
-
-            t_name = ""
-            if "name" in t_qso:
-                t_name = t_qso["name"]
-
-            rst_rcvd = ""
-            if "rst_rcvd" in t_qso:
-                rst_rcvd = t_qso["rst_rcvd"]
-
-            rst_sent = ""
-            if "rst_sent" in t_qso:
-                rst_sent = t_qso["rst_sent"]
-
-            l_qsl_sent_improved = False
-            if "qsl_sent" in t_qso:
-                l_qsl_sent_improved = t_qso["qsl_sent"] != "N"
-
-            l_country = ""
-            if "country" in t_qso:
-                l_country = t_qso["country"]
-
-            l_time_utc_on = ""
-            if "qso_date" in t_qso and "time_on" in t_qso:
-                l_time_utc_on = datetime.strptime(t_qso["qso_date"] + t_qso["time_on"], "%Y%m%d%H%M%S")
-
-            l_time_utc_off = ""
-            if "qso_date_off" in t_qso and "time_off" in t_qso:
-                l_time_utc_off = datetime.strptime(t_qso["qso_date_off"] + t_qso["time_off"], "%Y%m%d%H%M%S")
-            else:
-                l_time_utc_off = l_time_utc_on
-
-            l_calc_duration = 0
-            if l_time_utc_on != "" and l_time_utc_off != "":
-                if l_time_utc_on != l_time_utc_off:
-                    l_calc_duration = (l_time_utc_off - l_time_utc_on).total_seconds()
-
-            ret_qsos.append(QsoEntity(
-                call=t_qso["call"],
-                my_call=t_qso["station_callsign"],
-                time_utc_on=l_time_utc_on,
-                time_utc_off=l_time_utc_off,
-                mode=t_qso["mode"],
-                band=t_qso["band"],
-                sub_mode=t_qso["submode"] if "submode" in t_qso else None,
-                my_locator=t_qso["my_gridsquare"],
-                locator=t_qso["gridsquare"] if "gridsquare" in t_qso else None,
-                freq=round(float(t_qso["freq"]), 3),
-                qsl_sent=l_qsl_sent_improved,
-                country=l_country,
-                rst_rcvd=rst_rcvd,
-                rst_sent=rst_sent,
-                name=t_name,
-                calc_distance=calc_distance,
-                calc_duration=l_calc_duration
-            ))
-
-        except Exception as e:
-            print(f"- Warn by {str(t_qso).strip()}: {e} [skipped]")
-
-    ret_qsos.sort(key=lambda x: x.time_utc_off)
-
-    return ret_qsos
-
-
-def vis_barh_plot(vis_data, x_label, y_label, title, output_fp):
-    vis_data_f = []
-    for x in vis_data:
-        if x is not None:
-            vis_data_f.append(x)
-    vis_data = vis_data_f
-
-    counter = Counter(vis_data)
-    counter = dict(sorted(counter.items(), key=lambda item: item[1], reverse=True))
 
+def vis_barh_plot(counter: pd.Series, output_fp, x_label, y_label, title):
     plt.figure()
-    plt.barh(counter.keys(), counter.values())
+    plt.barh(counter.index.astype(str), counter.values)
     plt.xlabel(x_label)
     plt.ylabel(y_label)
     plt.title(title)
@@ -157,65 +60,75 @@ def vis_barh_plot(vis_data, x_label, y_label, title, output_fp):
     plt.close("all")
 
 
-def vis_map(items: [QsoEntity], fp="", fp_html="", static_mode=False):
-    print("Process Static Mode: ", static_mode)
+def vis_text(txt_out: str, output_fp):
+    print(txt_out)
 
-    worked_items = []
-    worked_grid_locators = []
+    with open(output_fp, "w") as f:
+        f.write(txt_out)
 
-    for item in items:
-        if item.locator is not None:
-            worked_items.append(item)
-            worked_grid_locators.append(item.locator)
 
-    # Convert to coordinates
-    worked_grid_locators_cp = []
-    items_cp = []
-    for locator, item in zip(worked_grid_locators, worked_items):
-        try:
-            worked_grid_locators_cp.append(LocationUtil.maidenhead_to_coordinates(locator))
-            items_cp.append(item)
-        except Exception as e:
-            print(f"- Warn by {str(item).strip()}: {locator}/{item.call}: {e}")
-
-    worked_grid_locators = worked_grid_locators_cp
-    worked_items = items_cp
-    del worked_grid_locators_cp, items_cp
-
-    coordinates = []
-    lines = []  #
-
-    for locator, item in zip(worked_grid_locators, worked_items):
-        out_time = item.time_utc_off.strftime("%Y-%m-%d %H:%M")
-
-        coordinates.append(
-            {
-                "HoverLabel": item.call + " (" + item.mode + ") " + str(
-                    item.freq) + " MHz " + out_time + " " + item.locator + " (" + str(
-                    int(round(item.calc_distance, 0))) + " km)",
-                "Latitude": locator.latitude,
-                "Longitude": locator.longitude,
-                "Band": item.band
-            }
-        )
-        lines.append(
-            {"start_lat": my_lat,
-             "start_lon": my_lon,
-             "end_lat": locator.latitude,
-             "end_lon": locator.longitude
-             })
+def vis_qso_per_date(df: pd.DataFrame, output_fp):
+    fig = px.bar(df, x="Date", y="Count", title="QSO per Date")
+    # No gaps and no (template) outline, as with px.histogram
+    fig.update_layout(bargap=0)
+    fig.update_traces(marker=dict(line=dict(width=0)))
+    fig.update_xaxes(tickangle=90)
+    fig.update_xaxes(title_text="Date")
+    fig.update_yaxes(title_text="Count")
+    # fig.update_traces(marker=dict(line=dict(width=0.5, color='DarkSlateGrey')))
+    fig.write_image(output_fp)
 
-    # Daten in ein DataFrame umwandeln
-    df = pd.DataFrame(coordinates)
 
-    # CHeck if Latitude and Longitude are present
-    if "Latitude" not in df.columns or "Longitude" not in df.columns:
-        print("WARN: No Latitude and Longitude found in DataFrame. Skipping map visualization.")
-        return
+def vis_qso_per_period(df: pd.DataFrame, output_fp, x, title, x_label):
+    fig = px.bar(df, x=x, y="Count", title=title)
+    if pd.api.types.is_numeric_dtype(df[x]):
+        # Numeric bins without gaps, as with px.histogram
+        fig.update_layout(bargap=0)
+    fig.update_xaxes(tickangle=90)
+    fig.update_xaxes(title_text=x_label)
+    fig.update_yaxes(title_text="Count")
+    fig.update_traces(marker=dict(line=dict(width=0.5, color='DarkSlateGrey')))
+    fig.write_image(output_fp)
+
+
+def vis_ft8_distance_vs_rst(df: pd.DataFrame, output_fp, y, title, y_label):
+    fig = px.scatter(df, x="Distance", y=y, title=title,
 
-    # Group by Latitute and Longitude
-    df = df.groupby(["Latitude", "Longitude"]).agg(
-        {"HoverLabel": lambda x: "<br>".join(x), "Band": "last"}).reset_index()
+                     color="Band"
+                     )
+    fig.update_xaxes(title_text="Distance [km]")
+    fig.update_yaxes(title_text=y_label)
+    fig.update_xaxes(tickangle=90)
+    # limit y to -30 to 30
+    fig.update_yaxes(range=[-30, 30])
+    fig.update_traces(marker=dict(line=dict(width=0.5, color='DarkSlateGrey')))
+    fig.write_image(output_fp)
+    # fig.show()
+
+
+def vis_distance(df: pd.DataFrame, output_fp):
+    # Bars at the bin centers with the bin size as width
+    fig = px.bar(df, x="Distance", y="Count", title="Distance")
+    fig.update_xaxes(title_text="Distance [km]")
+    fig.update_yaxes(title_text="Count")
+    fig.update_xaxes(tickangle=90)
+    fig.update_traces(width=df["Width"], marker=dict(line=dict(width=0.5, color='DarkSlateGrey')))
+    fig.write_image(output_fp)
+
+
+def vis_count_over_time(df: pd.DataFrame, output_fp):
+    fig = px.line(df, x="Date", y="RunningSum", title="QSO Count over Time")
+    fig.update_xaxes(title_text="Date")
+    fig.update_yaxes(title_text="Count")
+    fig.update_xaxes(tickangle=90)
+    # fig.show()
+    fig.write_image(output_fp)
+
+
+def vis_map(points: pd.DataFrame, fp="", fp_html="", static_mode=False):
+    print("Process Static Mode: ", static_mode)
+
+    df = points
 
     # Weltkarte mit den Koordinaten erstellen
     fig = px.scatter_mapbox(
@@ -317,57 +230,95 @@ def vis_map(items: [QsoEntity], fp="", fp_html="", static_mode=False):
     # fig.show()
 
 
-if __name__ == "__main__":
-    C_WORK_DATA_DIR = "workData/"
-
-    print("########################################")
-    print("[ADIF LOG ANALYZER]")
-    print("########################################")
-
-    # Load and parse ADIF files
-    print("\n[LOAD AND PARSE ADIF FILES]\n")
-
-    # Check if work data dir is present
-    assert os.path.exists(C_WORK_DATA_DIR), "Error: Work Data Dir not found"
-    # Get all ADIF files in input dir
-    adif_input_files = [f for f in os.listdir(C_WORK_DATA_DIR + "input/", ) if
-                        f.endswith(".adi") or f.endswith(".adif")]
-    assert len(adif_input_files) > 0, "Error: No ADIF files found in Input Dir"
-
-    all_qsos = get_all_qsos(adif_input_files)
-    del adif_input_files
-    assert len(all_qsos) > 0, "Error: No QSOs found in all ADIF files"
-
-    all_qsos_ent: [QsoEntity] = get_all_qsos_ent(all_qsos)
-    del all_qsos
-
-    # Output logbook overview
-    print("\n[Logbook Overview]\n")
-
-    num_total_qsos = len(all_qsos_ent)
-    num_send_qsl = len([x for x in all_qsos_ent if x.qsl_sent])
-    num_diff_locator = len(set([x.locator for x in all_qsos_ent if x.locator is not None]))
-    num_diff_my_locator = len(set([x.my_locator for x in all_qsos_ent]))
-    num_diff_my_call = len(set([x.my_call for x in all_qsos_ent]))
-    num_calc_distance = len([x for x in all_qsos_ent if x.calc_distance is not None])
+def vis_map_html(points: pd.DataFrame, fp_html):
+    vis_map(points, fp_html=fp_html, static_mode=False)
+
+
+def to_typed_array(values, dtype="f4") -> dict:
+    # plotly.js typed array (base64 instead of a JSON list of numbers)
+    values = np.ascontiguousarray(values, dtype="<" + dtype)
+    return {"dtype": dtype, "bdata": base64.b64encode(values.tobytes()).decode()}
+
+
+def vis_map_grid(cells: tuple, fp_html):
+    # One WebGL trace per cell size
+    max_qsos = cells[0]["QSOs"].max()
+
+    traces = []
+    for i, (t_chars, t_cells) in enumerate(zip(C_MAP_GRID_CHARS, cells)):
+        t_log_qsos = np.log10(t_cells["QSOs"].values)
+
+        traces.append({
+            "type": "scattermapbox",
+            "name": f"{t_chars} char locators",
+            "lat": to_typed_array(t_cells["Latitude"].values),
+            "lon": to_typed_array(t_cells["Longitude"].values),
+            "text": t_cells["HoverLabel"].tolist(),
+            "hoverinfo": "text",
+            "marker": {
+                "size": to_typed_array(6 + 3 * t_log_qsos if t_chars <= 4 else 4 + 2 * t_log_qsos),
+                "color": to_typed_array(t_log_qsos),
+                "cmin": 0,
+                "cmax": max(1.0, float(np.log10(max_qsos))),
+                "colorscale": "Viridis",
+                "showscale": i == 0,
+                "colorbar": {"title": {"text": "QSOs"}, "tickvals": [0, 1, 2, 3, 4, 5],
+                             "ticktext": ["1", "10", "100", "1k", "10k", "100k"]},
+            },
+            "visible": i == 0,
+        })
+
+    fig = go.Figure()
+    fig.update_layout(
+        mapbox_style="carto-darkmatter",
+        mapbox_zoom=1,
+        margin=dict(l=0, r=0, t=0, b=0),
+        showlegend=False,
+    )
+    fig = fig.to_dict()
+    fig["data"] = traces
+
+    # Level of detail: smaller cells from C_MAP_GRID_DETAIL_ZOOM on
+    post_script = """
+var gd = document.getElementById('{plot_id}');
+var detail = false;
+gd.on('plotly_relayout', function () {
+    var zoomed = gd._fullLayout.mapbox.zoom >= %s;
+    if (zoomed !== detail) {
+        detail = zoomed;
+        Plotly.restyle(gd, {visible: [!detail, detail]}, [0, 1]);
+    }
+});
+""" % C_MAP_GRID_DETAIL_ZOOM
+
+    # Figure as dict (typed arrays are not validated by plotly.py)
+    pio.write_html(fig, fp_html, validate=False, config={'scrollZoom': True}, full_html=True,
+                   post_script=post_script)
+
+
+def get_logbook_overview(qsos: QsoTable, stats: StatsUtil.QsoStats) -> str:
+    num_total_qsos = stats.num_total_qsos
+    num_send_qsl = stats.num_send_qsl
+    num_diff_locator = stats.num_distinct("locator")
+    num_diff_my_locator = stats.num_distinct("my_locator")
+    num_diff_my_call = stats.num_distinct("my_call")
+    num_calc_distance = stats.num_calc_distance
 
     # assert num_diff_my_locator == 1, "Error: Multiple My Locators found"
     if num_diff_my_locator != 1:
         print("WARNING: More than 1 My Locator found. Please check your ADIF files for consistency.")
-    my_locator = all_qsos_ent[0].my_locator
-    my_lat, my_lon = LocationUtil.maidenhead_to_coordinates(
-        my_locator).latitude, LocationUtil.maidenhead_to_coordinates(my_locator).longitude
+    my_locator = qsos.df["my_locator"].iloc[0]
 
     assert num_diff_my_call == 1, "Error: Multiple My Calls found"
-    my_call = all_qsos_ent[0].my_call
+    my_call = qsos.df["my_call"].iloc[0]
 
     txt_out = ""
     # print(f"Total QSO: {num_total_qsos}")
     txt_out += f"Total QSO: {num_total_qsos}\n"
-    # print(f"First QSO: {all_qsos_ent[0].time_utc_off}")
-    txt_out += f"First QSO: {all_qsos_ent[0].time_utc_off}\n"
-    # print(f"Last QSO: {all_qsos_ent[-1].time_utc_off}")
-    txt_out += f"Last QSO: {all_qsos_ent[-1].time_utc_off}\n"
+    # print(f"First QSO: {stats.first_qso}")
+    txt_out += f"First QSO: {stats.first_qso}\n"
+    # print(f"Last QSO: {stats.last_qso}")
+    txt_out += f"Last QSO: {stats.last_qso}\n"
     # print(f"Num Calc Dist: {num_calc_distance} ({round(num_calc_distance / num_total_qsos * 100, 2)}%)")
     txt_out += f"Num Calc Dist: {num_calc_distance} ({round(num_calc_distance / num_total_qsos * 100, 2)}%)\n"
     # print(f"Num Paper QSL Sent: {num_send_qsl} ({round(num_send_qsl / num_total_qsos * 100, 2)}%)")
@@ -379,290 +330,495 @@ if __name__ == "__main__":
     # print("My Call: " + my_call)
     txt_out += "My Call: " + my_call + "\n"
 
-    print(txt_out)
+    return txt_out
 
-    with open(f"{C_WORK_DATA_DIR}/output/ov_logbook.txt", "w") as f:
-        f.write(txt_out)
 
-    # Bar-Plot Modes
-    print("\n[Bar-Plot Modes]\n")
+def df_calls(calls: pd.DataFrame) -> str:
+    txt_out = ""
+
+    for i_call, i_name, i_last_date in zip(calls.index, calls["name"], calls["last_qso"]):
+        # print(f"{i_last_date} - {i_call}: {i_name}")
+        txt_out += f"{i_last_date} - {i_call}: {i_name}\n"
 
-    vis_barh_plot(
-        vis_data=[x.mode for x in all_qsos_ent],
-        x_label="Count",
-        y_label="Mode",
-        title="Mode",
-        output_fp=f"{C_WORK_DATA_DIR}/output/qso_modes.png"
-    )
+    return txt_out
 
-    vis_barh_plot(
-        vis_data=[x.sub_mode for x in all_qsos_ent],
-        x_label="Count",
-        y_label="Sub Mode",
-        title="Sub Mode",
-        output_fp=f"{C_WORK_DATA_DIR}/output/qso_sub_modes.png"
-    )
 
-    vis_barh_plot(
-        vis_data=[x.band for x in all_qsos_ent],
-        x_label="Count",
-        y_label="Band",
-        title="Band",
-        output_fp=f"{C_WORK_DATA_DIR}/output/qso_bands.png"
-    )
+def df_call_report(index: QsoIndex, sections: dict) -> str:
+    txt_out = ""
 
-    # Time-Plot Modes
-    print("\n[Time-Plot Modes]\n")
+    for i, (i_title, i_query) in enumerate(sections.items()):
+        # print(f"# {i_title} \n")
+        txt_out += ("\n" if i > 0 else "") + f"# {i_title} \n\n"
 
-    # Plot QSOS per day
-    df = pd.DataFrame([{"Date": x.time_utc_off.date(), "Count": 1} for x in all_qsos_ent])
-    fig = px.histogram(df, x="Date", y="Count", title="QSO per Date", nbins=len(set(df["Date"])) * 4)
-    fig.update_xaxes(tickangle=90)
-    fig.update_xaxes(title_text="Date")
-    fig.update_yaxes(title_text="Count")
-    # fig.update_traces(marker=dict(line=dict(width=0.5, color='DarkSlateGrey')))
-    fig.write_image(f"{C_WORK_DATA_DIR}/output/qso_per_date.png")
+        # QSOs by index lookups, group by call, sort by date of last QSO
+        txt_out += df_calls(StatsUtil.calls(index.select(i_query)))
 
-    # Plot QSOS per Month of the year
-    df = pd.DataFrame([{"Month": x.time_utc_off.month, "Count": 1} for x in all_qsos_ent])
-    df = df.sort_values(by="Month")
-    df["Month"] = df["Month"].map({1: "Jan", 2: "Feb", 3: "Mar", 4: "Apr", 5: "May", 6: "Jun", 7: "Jul", 8: "Aug",
-                                   9: "Sep", 10: "Oct", 11: "Nov", 12: "Dec"})
+    return txt_out
+
+
+def get_counts(stats: StatsUtil.QsoStats, column, n=None) -> pd.Series:
+    counter = stats.counts[column]
+    return counter if n is None else counter.head(n)
+
+
+# Histograms: one row per bin with the number of QSOs as "Count" (rendered as bars, independent of the number of QSOs)
+
+def get_qsos_per_date(stats: StatsUtil.QsoStats) -> pd.DataFrame:
+    return pd.DataFrame({"Date": stats.per_date.index, "Count": stats.per_date.values})
+
+
+def get_qsos_per_month(stats: StatsUtil.QsoStats) -> pd.DataFrame:
     # Dec should be last
-    fig = px.histogram(df, x="Month", y="Count", title="QSO per Month of the Year", nbins=12)
-    fig.update_xaxes(tickangle=90)
-    fig.update_xaxes(title_text="Month of the Year")
-    fig.update_yaxes(title_text="Count")
-    fig.update_traces(marker=dict(line=dict(width=0.5, color='DarkSlateGrey')))
-    fig.write_image(f"{C_WORK_DATA_DIR}/output/qso_per_month_of_year.png")
-
-    # Plot QSOS per Day of the week
-    df = pd.DataFrame([{"Weekday": x.time_utc_off.weekday(), "Count": 1} for x in all_qsos_ent])
-    # Sort by weekday
-    df = df.sort_values(by="Weekday")
-    df["Weekday"] = df["Weekday"].map({0: "Mo", 1: "Tu", 2: "We", 3: "Th", 4: "Fr", 5: "Sa", 6: "Su"})
-    fig = px.histogram(df, x="Weekday", y="Count", title="QSO per Day of the Week", nbins=7)
-    fig.update_xaxes(tickangle=90)
-    fig.update_xaxes(title_text="Day of the Week")
-    fig.update_yaxes(title_text="Count")
-    fig.update_traces(marker=dict(line=dict(width=0.5, color='DarkSlateGrey')))
-    fig.write_image(f"{C_WORK_DATA_DIR}/output/qso_per_day_of_week.png")
+    return pd.DataFrame({"Month": stats.per_month.index.map({1: "Jan", 2: "Feb", 3: "Mar", 4: "Apr", 5: "May", 6: "Jun",
+                                                             7: "Jul", 8: "Aug", 9: "Sep", 10: "Oct", 11: "Nov",
+                                                             12: "Dec"}),
+                         "Count": stats.per_month.values})
 
-    # Plot QSOS per Hour of the day
-    df = pd.DataFrame([{"Hour": x.time_utc_off.hour, "Count": 1} for x in all_qsos_ent])
-    fig = px.histogram(df, x="Hour", y="Count", title="QSO per Hour of the Day", nbins=24)
-    fig.update_xaxes(tickangle=90)
-    fig.update_xaxes(title_text="Hour of the Day")
-    fig.update_yaxes(title_text="Count")
-    fig.update_traces(marker=dict(line=dict(width=0.5, color='DarkSlateGrey')))
-    fig.write_image(f"{C_WORK_DATA_DIR}/output/qso_per_hour_of_day.png")
-
-    # FT8 Plots
-    print("\n[FT8 Plots]\n")
-
-    all_qsos_ft8 = [x for x in all_qsos_ent if x.mode == "FT8"]
-
-    if len(all_qsos_ft8) > 0:
-        # Plot with distance on x-axis and RST_Sent on y-axis (scatter)
-        df = pd.DataFrame([{"Distance": x.calc_distance, "RST_Sent": x.rst_sent, "Band": x.band} for x in all_qsos_ft8])
-        df = df[df["RST_Sent"] != ""]
-        df["RST_Sent"] = df["RST_Sent"].map(lambda x: x.replace("--", "-"))
-        df["RST_Sent"] = df["RST_Sent"].map(lambda x: int(x))
-        fig = px.scatter(df, x="Distance", y="RST_Sent", title="FT8: Distance vs. RST Sent",
-
-                         color="Band"
-                         )
-        fig.update_xaxes(title_text="Distance [km]")
-        fig.update_yaxes(title_text="RST Sent SNR [dB]")
-        fig.update_xaxes(tickangle=90)
-        # limit y to -30 to 30
-        fig.update_yaxes(range=[-30, 30])
-        fig.update_traces(marker=dict(line=dict(width=0.5, color='DarkSlateGrey')))
-        fig.write_image(f"{C_WORK_DATA_DIR}/output/ft8_distance_vs_rst_sent.png")
-        # fig.show()
-
-        df = pd.DataFrame([{"Distance": x.calc_distance, "rst_rcvd": x.rst_rcvd, "Band": x.band} for x in all_qsos_ft8])
-        df = df[df["rst_rcvd"] != ""]
-        df["rst_rcvd"] = df["rst_rcvd"].map(lambda x: x.replace("--", "-"))
-        df["rst_rcvd"] = df["rst_rcvd"].map(lambda x: int(x))
-        fig = px.scatter(df, x="Distance", y="rst_rcvd", title="FT8: Distance vs. RST Rcvd",
-
-                         color="Band"
-                         )
-        fig.update_xaxes(title_text="Distance [km]")
-        fig.update_yaxes(title_text="RST Rcvd SNR [dB]")
-        fig.update_xaxes(tickangle=90)
-        # limit y to -30 to 30
-        fig.update_yaxes(range=[-30, 30])
-        fig.update_traces(marker=dict(line=dict(width=0.5, color='DarkSlateGrey')))
-        fig.write_image(f"{C_WORK_DATA_DIR}/output/ft8_distance_vs_rst_rcvd.png")
-        # fig.show()
-    else:
+
+def get_qsos_per_weekday(stats: StatsUtil.QsoStats) -> pd.DataFrame:
+    return pd.DataFrame({"Weekday": stats.per_weekday.index.map({0: "Mo", 1: "Tu", 2: "We", 3: "Th", 4: "Fr", 5: "Sa",
+                                                                 6: "Su"}),
+                         "Count": stats.per_weekday.values})
+
+
+def get_qsos_per_hour(stats: StatsUtil.QsoStats) -> pd.DataFrame:
+    return pd.DataFrame({"Hour": stats.per_hour.index, "Count": stats.per_hour.values})
+
+
+def get_ft8_qsos(qsos: QsoTable) -> Optional[pd.DataFrame]:
+    all_qsos_ft8 = qsos.df[qsos.df["mode"] == "FT8"]
+
+    if len(all_qsos_ft8) == 0:
         print("WARN: No FT8 QSOs found. Skipping FT8 specific plots.")
+        return None
 
-    # Hist Mode
-    print("\n[Hist Mode]\n")
-
-    # Plot Distance
-    df = pd.DataFrame([{"Distance": x.calc_distance} for x in all_qsos_ent if x.calc_distance is not None])
-    if len(df) > 0:
-        fig = px.histogram(df, x="Distance", title="Distance", nbins=100)
-        fig.update_xaxes(title_text="Distance [km]")
-        fig.update_yaxes(title_text="Count")
-        fig.update_xaxes(tickangle=90)
-        fig.update_traces(marker=dict(line=dict(width=0.5, color='DarkSlateGrey')))
-        fig.write_image(f"{C_WORK_DATA_DIR}/output/qso_distance.png")
-    else:
+    return all_qsos_ft8.reset_index(drop=True)
+
+
+def get_ft8_distance_vs_rst(all_qsos_ft8: Optional[pd.DataFrame], column, label) -> Optional[pd.DataFrame]:
+    if all_qsos_ft8 is None:
+        return None
+
+    df = pd.DataFrame({"Distance": all_qsos_ft8["calc_distance"],
+                       label: all_qsos_ft8[column].astype(str),
+                       "Band": all_qsos_ft8["band"].astype(object)})
+    df = df[df[label] != ""]
+    df[label] = df[label].str.replace("--", "-").astype(int)
+    return df
+
+
+def get_distances(qsos: QsoTable) -> Optional[pd.DataFrame]:
+    starts, counts, size = StatsUtil.bin_values(qsos.df["calc_distance"].values, 100)
+
+    if len(counts) == 0:
         print("WARN: No QSOs with distance found. Skipping distance histogram.")
+        return None
 
-    print("\n[QSO Count over Time]\n")
+    return pd.DataFrame({"Distance": starts + size / 2, "Count": counts, "Width": size})
 
-    df = pd.DataFrame([{"Date": x.time_utc_off.date(), "Count": 1} for x in all_qsos_ent])
-    df = df.groupby("Date").agg({"Count": "sum"}).reset_index()
-    df["RunningSum"] = df["Count"].cumsum()
-    fig = px.line(df, x="Date", y="RunningSum", title="QSO Count over Time")
-    fig.update_xaxes(title_text="Date")
-    fig.update_yaxes(title_text="Count")
-    fig.update_xaxes(tickangle=90)
-    # fig.show()
-    fig.write_image(f"{C_WORK_DATA_DIR}/output/qso_count_over_time.png")
-
-    # Top n state
-    print("\n[Top N Stats]\n")
-
-    all_items = [x.call for x in all_qsos_ent]
-    all_items = [x for x in all_items if x is not None]
-    counter = Counter(all_items)
-    counter = dict(sorted(counter.items(), key=lambda item: item[1], reverse=True))
-    counter = dict(list(counter.items())[:25])
-    plt.barh(list(counter.keys()), counter.values())
-    plt.xlabel("Count")
-    plt.ylabel("Station")
-    plt.title("Top 25: Stations")
-    plt.tight_layout()
-    # plt.show()
-    plt.savefig(f"{C_WORK_DATA_DIR}/output/stats_top_stations.png")
-    plt.close("all")
 
-    all_items = [x.locator for x in all_qsos_ent]
-    all_items = [x for x in all_items if x is not None]
-    counter = Counter(all_items)
-    counter = dict(sorted(counter.items(), key=lambda item: item[1], reverse=True))
-    counter = dict(list(counter.items())[:25])
-    plt.barh(list(counter.keys()), counter.values())
-    plt.xlabel("Count")
-    plt.ylabel("Locator")
-    plt.title("Top 25: Locators")
-    plt.tight_layout()
-    # plt.show()
-    plt.savefig(f"{C_WORK_DATA_DIR}/output/stats_top_locators.png")
-    plt.close("all")
+def get_count_over_time(stats: StatsUtil.QsoStats) -> pd.DataFrame:
+    df = get_qsos_per_date(stats)
+    df["RunningSum"] = df["Count"].cumsum()
+    return df
 
-    all_items = [x.country for x in all_qsos_ent]
-    all_items = [x for x in all_items if x is not None]
-    counter = Counter(all_items)
-    counter = dict(sorted(counter.items(), key=lambda item: item[1], reverse=True))
-    counter = dict(list(counter.items())[:25])
-    plt.barh(list(counter.keys()), counter.values())
-    plt.xlabel("Count")
-    plt.ylabel("Country")
-    plt.title("Top 25: Countries")
-    plt.tight_layout()
-    # plt.show()
-    plt.savefig(f"{C_WORK_DATA_DIR}/output/stats_top_countries.png")
-    plt.close("all")
 
+def get_top_durations(qsos: QsoTable) -> pd.Series:
     # Get top 25 qso with max duration
-    all_items_cp = all_qsos_ent.copy()
-    all_items_cp.sort(key=lambda x: x.calc_duration, reverse=True)
-    all_items_cp = all_items_cp[:25]
-    data_x = []
-    data_y = []
-    for item in all_items_cp:
-        data_x.append(item.call + " (" + item.mode + ")")
-        data_y.append(item.calc_duration // 60)
-    plt.barh(data_x, data_y)
-    plt.xlabel("Duration [min]")
-    plt.ylabel("Station (Mode)")
-    plt.title("Top 25: Durations")
-    plt.tight_layout()
-    # plt.show()
-    plt.savefig(f"{C_WORK_DATA_DIR}/output/stats_top_longest_qso.png")
-    plt.close("all")
+    all_items_cp = qsos.df.sort_values("calc_duration", ascending=False, kind="stable").head(25)
+    data_x = all_items_cp["call"].astype(str) + " (" + all_items_cp["mode"].astype(str) + ")"
+    data_y = all_items_cp["calc_duration"] // 60
+    return pd.Series(data_y.values, index=pd.Index(data_x.values))
+
+
+def get_map_points(qsos: QsoTable) -> Optional[pd.DataFrame]:
+    # One point per location: hover labels of all QSOs there, band of the last QSO
+    worked_items = qsos.df[qsos.df["locator"].notna()]
+
+    # Convert to coordinates
+    latitudes, longitudes, valid = LocationUtil.maidenhead_to_coordinates_batch(worked_items["locator"].astype(str))
+    for locator, call in zip(worked_items["locator"][~valid], worked_items["call"][~valid]):
+        print(f"- Warn by {locator}/{call}: Invalid Maidenhead locator")
+
+    worked_items = worked_items[valid].reset_index(drop=True)
+    latitudes = latitudes[valid]
+    longitudes = longitudes[valid]
+
+    # CHeck if Latitude and Longitude are present
+    if len(worked_items) == 0:
+        print("WARN: No Latitude and Longitude found in DataFrame. Skipping map visualization.")
+        return None
+
+    labels = (worked_items["call"].astype(str) + " (" + worked_items["mode"].astype(str) + ") "
+              + worked_items["freq"].astype(str) + " MHz "
+              + np.char.replace(np.datetime_as_string(worked_items["time_utc_off"].values.astype("datetime64[m]")),
+                                "T", " ").astype(object) + " "
+              + worked_items["locator"].astype(str) + " ("
+              + worked_items["calc_distance"].round(0).astype(int).astype(str) + " km)").values
+
+    # Group by Latitude and Longitude: sort by location (stable, QSOs of a location stay in order), groups are the
+    # runs of equal coordinates
+    order = np.lexsort((longitudes, latitudes))
+    latitudes, longitudes, labels = latitudes[order], longitudes[order], labels[order].tolist()
+    bands = worked_items["band"].astype(object).values[order]
+
+    is_start = np.ones(len(order), dtype=bool)
+    is_start[1:] = (latitudes[1:] != latitudes[:-1]) | (longitudes[1:] != longitudes[:-1])
+    starts = np.flatnonzero(is_start)
+    ends = np.append(starts[1:], len(order))
+
+    return pd.DataFrame({
+        "Latitude": latitudes[starts],
+        "Longitude": longitudes[starts],
+        "HoverLabel": ["<br>".join(labels[x:y]) for x, y in zip(starts.tolist(), ends.tolist())],
+        "Band": bands[ends - 1],
+    })
+
+
+def vis_map_static(data: tuple, fp):
+    # Without map tiles (no network access): bundled country outlines, great circle paths and points by band
+    points, home_lat, home_lon = data
+
+    fig = plt.figure(figsize=(19.2, 10.8), facecolor=C_MAP_STATIC_COLORS["water"])
+    ax = fig.add_axes((0, 0, 1, 1))
+    ax.set_facecolor(C_MAP_STATIC_COLORS["water"])
+    ax.set_axis_off()
+
+    outlines = [np.column_stack(MapUtil.project(x[:, 1], x[:, 0])) for x in MapUtil.get_outlines()]
+    ax.add_collection(PolyCollection(outlines, facecolors=C_MAP_STATIC_COLORS["land"],
+                                     edgecolors=C_MAP_STATIC_COLORS["border"], linewidths=0.4, zorder=1))
+
+    # Great circle paths as segments, segments crossing the antimeridian are dropped
+    if home_lat is not None:
+        t_lat, t_lon = LocationUtil.great_circle_paths(home_lat, home_lon, points["Latitude"].values,
+                                                       points["Longitude"].values, num_points=C_MAP_STATIC_PATH_POINTS)
+        t_x, t_y = MapUtil.project(t_lat, t_lon)
+        t_xy = np.stack([t_x, t_y], axis=-1)
+        segments = np.stack([t_xy[:, :-1], t_xy[:, 1:]], axis=2).reshape(-1, 2, 2)
+        segments = segments[np.abs(segments[:, 1, 0] - segments[:, 0, 0]) <= 180]
+        ax.add_collection(LineCollection(segments, colors=C_MAP_STATIC_COLORS["path"], linewidths=0.4, zorder=2))
+
+    # One scatter per band, colors in order of appearance (as plotly express)
+    x, y = MapUtil.project(points["Latitude"].values, points["Longitude"].values)
+    bands = points["Band"].astype(str).values
+    for t_band, t_color in zip(pd.unique(bands), itertools.cycle(px.colors.qualitative.Plotly)):
+        t_rows = bands == t_band
+        ax.scatter(x[t_rows], y[t_rows], s=42, color=t_color, linewidths=0, label=t_band, zorder=3)
+
+    ax.legend(title="Band", loc="upper right")
+
+    # Whole world, centered between 58 S and 84 N with the height of the figure aspect (equal scale of x and y)
+    t_center = MapUtil.project([-58, 84], [0, 0])[1].mean()
+    t_height = 360 * fig.get_figheight() / fig.get_figwidth()
+    ax.set_xlim(-180, 180)
+    ax.set_ylim(t_center - t_height / 2, t_center + t_height / 2)
+
+    fig.savefig(fp, dpi=300, facecolor=fig.get_facecolor())
+    plt.close(fig)
+
+
+def get_map_static(points: Optional[pd.DataFrame], qsos: QsoTable) -> Optional[tuple]:
+    # Map points and own location
+    if points is None:
+        return None
+
+    home_lat, home_lon, valid = LocationUtil.maidenhead_to_coordinates_batch([str(qsos.df["my_locator"].iloc[0])])
+    if not valid[0]:
+        print("WARN: Invalid own locator. Skipping the great circle paths of the static map.")
+        return points, None, None
+
+    return points, float(home_lat[0]), float(home_lon[0])
+
+
+def get_map_grid(qsos: QsoTable) -> Optional[tuple]:
+    # Cells per size of C_MAP_GRID_CHARS: center, number of QSOs and calls, QSOs per band
+    df = qsos.df[qsos.df["locator"].notna()]
+
+    # Check if locators are present
+    if len(df) == 0:
+        print("WARN: No locators found. Skipping grid map visualization.")
+        return None
+
+    codes = df["locator"].cat.codes.values
+    locators = np.char.strip(df["locator"].cat.categories.values.astype(str))
+    calls = df["call"].cat.codes.values
+    bands = df["band"].cat.codes.values
+    band_names = df["band"].cat.categories.values.astype(str)
+
+    ret = []
+    for t_chars in C_MAP_GRID_CHARS:
+        # Cell of the distinct locators (e.g. JN59 / JN59nk), too short or invalid -1
+        t_cells = np.array([x[:2].upper() + x[2:4] + x[4:t_chars].lower() for x in locators.tolist()], dtype=str)
+        t_lat, t_lon, t_valid = LocationUtil.maidenhead_to_coordinates_batch(t_cells)
+        t_valid &= np.char.str_len(locators) >= t_chars
+
+        t_cell_idx, t_cell_names = pd.factorize(pd.Series(t_cells).where(t_valid))
+        t_cell_lat = np.zeros(len(t_cell_names))
+        t_cell_lon = np.zeros(len(t_cell_names))
+        t_cell_lat[t_cell_idx[t_valid]] = t_lat[t_valid]
+        t_cell_lon[t_cell_idx[t_valid]] = t_lon[t_valid]
+
+        # Cell of every QSO
+        t_row_cells = t_cell_idx[codes]
+        t_rows = t_row_cells >= 0
+        t_row_cells = t_row_cells[t_rows]
+
+        num_cells = len(t_cell_names)
+        num_qsos = np.bincount(t_row_cells, minlength=num_cells)
+        num_calls = np.bincount(np.unique(t_row_cells * (calls.max() + 2) + calls[t_rows] + 1) // (calls.max() + 2),
+                                minlength=num_cells)
+
+        # QSOs per cell and band, sorted by cell and descending count
+        t_pairs, t_pair_counts = np.unique(t_row_cells * (len(band_names) + 1) + bands[t_rows] + 1, return_counts=True)
+        t_pair_cells = t_pairs // (len(band_names) + 1)
+        t_pair_bands = t_pairs % (len(band_names) + 1) - 1
+        t_order = np.lexsort((-t_pair_counts, t_pair_cells))
+        t_pair_cells, t_pair_bands, t_pair_counts = t_pair_cells[t_order], t_pair_bands[t_order], t_pair_counts[t_order]
+        t_pair_labels = [f"{band_names[x] if x >= 0 else '?'}: {y}" for x, y in
+                         zip(t_pair_bands.tolist(), t_pair_counts.tolist())]
+        t_starts = np.searchsorted(t_pair_cells, np.arange(num_cells + 1))
+
+        ret.append(pd.DataFrame({
+            "Cell": t_cell_names.values,
+            # Center of the cell (the locator is the south-west corner)
+            "Latitude": t_cell_lat + (0.5 if t_chars == 4 else 1.25 / 60),
+            "Longitude": t_cell_lon + (1.0 if t_chars == 4 else 2.5 / 60),
+            "QSOs": num_qsos,
+            "HoverLabel": [f"{w}: {x} QSOs, {y} calls<br>{', '.join(t_pair_labels[z[0]:z[1]])}" for w, x, y, z in
+                           zip(t_cell_names.values, num_qsos.tolist(), num_calls.tolist(),
+                               zip(t_starts[:-1].tolist(), t_starts[1:].tolist()))],
+        }))
+
+    # Check if cells are present
+    if len(ret[0]) == 0:
+        print("WARN: No grid cells found. Skipping grid map visualization.")
+        return None
+
+    return tuple(ret)
+
+
+def get_render_pipeline(output_dir, manifest_fp=None, jobs=1, call_reports: Optional[dict] = None,
+                        map_backend="offline") -> RenderPipeline:
+    # Callsign reports in addition to C_CALL_REPORTS, renderer of qso_map.png (see C_MAP_BACKENDS)
+    pipeline = RenderPipeline(manifest_fp, version=C_RENDER_VERSION, jobs=jobs)
+    call_reports = {**C_CALL_REPORTS, **(call_reports or {})}
+
+    # Aggregates (of the input "qsos"), counters and time histograms of all outputs in one pass ("stats")
+    pipeline.add_aggregate("stats", StatsUtil.aggregate, ["qsos"])
+    pipeline.add_aggregate("overview", get_logbook_overview, ["qsos", "stats"])
+    for t_column in ["mode", "sub_mode", "band"]:
+        pipeline.add_aggregate(f"{t_column}_counts", partial(get_counts, column=t_column), ["stats"])
+    pipeline.add_aggregate("qsos_per_date", get_qsos_per_date, ["stats"])
+    pipeline.add_aggregate("qsos_per_month", get_qsos_per_month, ["stats"])
+    pipeline.add_aggregate("qsos_per_weekday", get_qsos_per_weekday, ["stats"])
+    pipeline.add_aggregate("qsos_per_hour", get_qsos_per_hour, ["stats"])
+    pipeline.add_aggregate("ft8_qsos", get_ft8_qsos, ["qsos"])
+    pipeline.add_aggregate("ft8_rst_sent", partial(get_ft8_distance_vs_rst, column="rst_sent", label="RST_Sent"),
+                           ["ft8_qsos"])
+    pipeline.add_aggregate("ft8_rst_rcvd", partial(get_ft8_distance_vs_rst, column="rst_rcvd", label="rst_rcvd"),
+                           ["ft8_qsos"])
+    pipeline.add_aggregate("distances", get_distances, ["qsos"])
+    pipeline.add_aggregate("count_over_time", get_count_over_time, ["stats"])
+    for t_column in ["call", "locator", "country"]:
+        pipeline.add_aggregate(f"top_{t_column}", partial(get_counts, column=t_column, n=25), ["stats"])
+    pipeline.add_aggregate("top_durations", get_top_durations, ["qsos"])
+    pipeline.add_aggregate("qso_index", QsoIndex, ["qsos"])
+    for t_name, t_sections in call_reports.items():
+        pipeline.add_aggregate(f"report_{t_name}", partial(df_call_report, sections=t_sections), ["qso_index"])
+    pipeline.add_aggregate("map_points", get_map_points, ["qsos"])
+    pipeline.add_aggregate("map_grid", get_map_grid, ["qsos"])
+    pipeline.add_aggregate("map_static", get_map_static, ["map_points", "qsos"])
+
+    # Outputs
+    pipeline.add_output(f"{output_dir}/ov_logbook.txt", "overview", vis_text)
+
+    pipeline.add_output(f"{output_dir}/qso_modes.png", "mode_counts",
+                        partial(vis_barh_plot, x_label="Count", y_label="Mode", title="Mode"))
+    pipeline.add_output(f"{output_dir}/qso_sub_modes.png", "sub_mode_counts",
+                        partial(vis_barh_plot, x_label="Count", y_label="Sub Mode", title="Sub Mode"))
+    pipeline.add_output(f"{output_dir}/qso_bands.png", "band_counts",
+                        partial(vis_barh_plot, x_label="Count", y_label="Band", title="Band"))
+
+    pipeline.add_output(f"{output_dir}/qso_per_date.png", "qsos_per_date", vis_qso_per_date)
+    pipeline.add_output(f"{output_dir}/qso_per_month_of_year.png", "qsos_per_month",
+                        partial(vis_qso_per_period, x="Month", title="QSO per Month of the Year",
+                                x_label="Month of the Year"))
+    pipeline.add_output(f"{output_dir}/qso_per_day_of_week.png", "qsos_per_weekday",
+                        partial(vis_qso_per_period, x="Weekday", title="QSO per Day of the Week",
+                                x_label="Day of the Week"))
+    pipeline.add_output(f"{output_dir}/qso_per_hour_of_day.png", "qsos_per_hour",
+                        partial(vis_qso_per_period, x="Hour", title="QSO per Hour of the Day",
+                                x_label="Hour of the Day"))
+
+    pipeline.add_output(f"{output_dir}/ft8_distance_vs_rst_sent.png", "ft8_rst_sent",
+                        partial(vis_ft8_distance_vs_rst, y="RST_Sent", title="FT8: Distance vs. RST Sent",
+                                y_label="RST Sent SNR [dB]"))
+    pipeline.add_output(f"{output_dir}/ft8_distance_vs_rst_rcvd.png", "ft8_rst_rcvd",
+                        partial(vis_ft8_distance_vs_rst, y="rst_rcvd", title="FT8: Distance vs. RST Rcvd",
+                                y_label="RST Rcvd SNR [dB]"))
+
+    pipeline.add_output(f"{output_dir}/qso_distance.png", "distances", vis_distance)
+    pipeline.add_output(f"{output_dir}/qso_count_over_time.png", "count_over_time", vis_count_over_time)
+
+    pipeline.add_output(f"{output_dir}/stats_top_stations.png", "top_call",
+                        partial(vis_barh_plot, x_label="Count", y_label="Station", title="Top 25: Stations"))
+    pipeline.add_output(f"{output_dir}/stats_top_locators.png", "top_locator",
+                        partial(vis_barh_plot, x_label="Count", y_label="Locator", title="Top 25: Locators"))
+    pipeline.add_output(f"{output_dir}/stats_top_countries.png", "top_country",
+                        partial(vis_barh_plot, x_label="Count", y_label="Country", title="Top 25: Countries"))
+    pipeline.add_output(f"{output_dir}/stats_top_longest_qso.png", "top_durations",
+                        partial(vis_barh_plot, x_label="Duration [min]", y_label="Station (Mode)",
+                                title="Top 25: Durations"))
+
+    for t_name in call_reports:
+        pipeline.add_output(f"{output_dir}/ov_{t_name}.txt", f"report_{t_name}", vis_text)
+
+    # Map data prepared once for both maps
+    if map_backend == "offline":
+        pipeline.add_output(f"{output_dir}/qso_map.png", "map_static", vis_map_static)
+    else:
+        pipeline.add_output(f"{output_dir}/qso_map.png", "map_points", partial(vis_map, static_mode=True))
+    pipeline.add_output(f"{output_dir}/qso_map.html", "map_points", vis_map_html)
+    pipeline.add_output(f"{output_dir}/qso_map_grid.html", "map_grid", vis_map_grid)
+
+    return pipeline
 
-    # Dynamic Filter
-    print("\n[Dynamic Filter]\n")
 
+if __name__ == "__main__":
+    C_WORK_DATA_DIR = "workData/"
+
+    parser = argparse.ArgumentParser(description="ADIF Log Analyzer")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Number of worker processes for parsing the ADIF files (default: 1)")
+    parser.add_argument("--render-jobs", type=int, default=1,
+                        help="Number of worker processes for rendering the charts and maps (default: 1)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Do not use the persistent logbook, location and render caches in the work data dir")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running, watch the input dir and re-render the outputs affected by changes")
+    parser.add_argument("--interval", type=float, default=2.0,
+                        help="Polling interval of --watch in seconds (default: 2)")
+    parser.add_argument("--since", default=None,
+                        help="Only QSOs with end at or after this time (UTC, e.g. 2024-06-01 or \"2024-06-01 12:00\")")
+    parser.add_argument("--until", default=None,
+                        help="Only QSOs with end before this time (UTC, e.g. 2024-06-03)")
+    parser.add_argument("--filter", action="append", default=[], metavar="FILTER=VALUE[,VALUE...]",
+                        help="Callsign report ov_query.txt of the QSOs matching all filters (repeatable, filters: "
+                             f"{', '.join(QsoIndex.C_FILTERS)}), e.g. --filter prefix=DL,DK --filter band=20m")
+    parser.add_argument("--query-file", default=None,
+                        help="JSON file with callsign reports ov_<name>.txt: {name: {section title: query}}, a query "
+                             "is a dict of filters or a list of them (e.g. {\"dx\": {\"DX 20m\": {\"band\": \"20m\", "
+                             "\"regex\": \"^[^D]\"}}})")
+    parser.add_argument("--map-backend", choices=C_MAP_BACKENDS, default="offline",
+                        help="Renderer of qso_map.png: \"offline\" (bundled country outlines, no network access) or "
+                             "\"mapbox\" (tile map, needs network access) (default: offline)")
+    args = parser.parse_args()
+
+    # Ad-hoc callsign reports (checked before anything is loaded)
+    query_reports = {}
+    try:
+        if args.query_file is not None:
+            with open(args.query_file, "r") as f:
+                query_reports.update(json.load(f))
+            for t_name, t_sections in query_reports.items():
+                if not isinstance(t_sections, dict):
+                    raise ValueError(f"Report '{t_name}' is no dict of section title -> query")
+                for t_query in t_sections.values():
+                    QsoIndex.check_query(t_query)
+        if len(args.filter) > 0:
+            query_reports["query"] = {" ".join(args.filter): QsoIndex.parse_filters(args.filter)}
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    print("########################################")
+    print("[ADIF LOG ANALYZER]")
+    print("########################################")
+
+    # Check if work data dir is present
+    assert os.path.exists(C_WORK_DATA_DIR), "Error: Work Data Dir not found"
+
+
+    def get_adif_input_files() -> [str]:
+        # Get all ADIF files in input dir
+        return [f for f in os.listdir(C_WORK_DATA_DIR + "input/", ) if f.endswith(".adi") or f.endswith(".adif")]
 
-    def df_germany(fp_out=""):
 
-        txt_out = ""
+    def load_qsos(adif_input_files) -> QsoTable:
+        # Load and parse ADIF files
+        print("\n[LOAD AND PARSE ADIF FILES]\n")
 
-        # print("# Club Stations Germany \n")
-        txt_out += "# Club Stations Germany \n\n"
+        assert len(adif_input_files) > 0, "Error: No ADIF files found in Input Dir"
 
-        # Filter
-        filtered_items = [x for x in all_qsos_ent if x.country == "Federal Republic Of Germany"]
-        filtered_items = [x for x in filtered_items if x.call[2] == "0"]
-        filtered_items = [x for x in filtered_items if x.call[1] != "J"]
-        # map to call
-        filtered_items_call = [x.call for x in filtered_items]
-        filtered_items_call = list(set(filtered_items_call))
+        print(f"Found {len(adif_input_files)} ADIF files: ")
 
-        # sort by date
-        filtered_items_call.sort(key=lambda x: [y.time_utc_off for y in filtered_items if y.call == x][-1])
+        # Columnar table (canonical data model for all statistics, plots and filters), unchanged files from the cache
+        qsos = LogbookUtil.load_qsos(C_WORK_DATA_DIR + "input/", adif_input_files, jobs=args.jobs,
+                                     cache_dir=None if args.no_cache else C_WORK_DATA_DIR + "cache/")
+        assert len(qsos) > 0, "Error: No QSOs found in all ADIF files"
 
-        for item in filtered_items_call:
-            i_call = item
-            i_name = [x.name for x in filtered_items if x.call == i_call][0]
-            i_last_date = [x.time_utc_off for x in filtered_items if x.call == i_call][-1]
-            # print(f"{i_last_date} - {i_call}: {i_name}")
-            txt_out += f"{i_last_date} - {i_call}: {i_name}\n"
+        # Time window (slice of the sorted table by binary search)
+        if args.since is not None or args.until is not None:
+            num_all_qsos = len(qsos)
+            qsos = QsoIndex(qsos).window(args.since, args.until)
+            print(f"Window {args.since or '*'} - {args.until or '*'}: {len(qsos)} of {num_all_qsos} QSOs")
+            assert len(qsos) > 0, "Error: No QSOs found in the time window"
 
-        # print("\n# Special Stations Germany \n")
-        txt_out += "\n# Special Stations Germany \n\n"
+        return qsos
 
-        # Filter
-        filtered_items = [x for x in all_qsos_ent if x.country == "Federal Republic Of Germany"]
-        # Add items with DP0
-        filtered_items = filtered_items + [x for x in all_qsos_ent if x.call[:3] == "DP0"]
-        filtered_items_cp = []
-        for item in filtered_items:
-            t_call = item.call
-            # Check if special call (with at least two digits)
-            if len([x for x in t_call if x.isdigit()]) >= 2:
-                filtered_items_cp.append(item)
-            # Check if started with DP0
-            if t_call[:3] == "DP0":
-                filtered_items_cp.append(item)
-        filtered_items = filtered_items_cp
 
-        # map to call
-        filtered_items_call = [x.call for x in filtered_items]
-        filtered_items_call = list(set(filtered_items_call))
+    def render(pipeline: RenderPipeline, qsos: QsoTable) -> RenderPipeline.Summary:
+        print("\n[RENDER OUTPUTS]\n")
 
-        # sort by date
-        filtered_items_call.sort(key=lambda x: [y.time_utc_off for y in filtered_items if y.call == x][-1])
+        summary = pipeline.run({"qsos": qsos})
 
-        for item in filtered_items_call:
-            i_call = item
-            i_name = [x.name for x in filtered_items if x.call == i_call][0]
-            i_last_date = [x.time_utc_off for x in filtered_items if x.call == i_call][-1]
-            # print(f"{i_last_date} - {i_call}: {i_name}")
-            txt_out += f"{i_last_date} - {i_call}: {i_name}\n"
+        print()
+        RenderPipeline.print_summary(summary)
 
-        print(txt_out)
+        return summary
 
-        if fp_out != "":
-            with open(fp_out, "w") as f:
-                f.write(txt_out)
 
+    # Outputs are only rendered again if their data changed since they were written
+    render_pipeline = get_render_pipeline(f"{C_WORK_DATA_DIR}output",
+                                          None if args.no_cache else C_WORK_DATA_DIR + "cache/render.json",
+                                          args.render_jobs, query_reports, args.map_backend)
 
-    df_germany(fp_out=f"{C_WORK_DATA_DIR}/output/ov_germany.txt")
+    if not args.watch:
+        render_summary = render(render_pipeline, load_qsos(get_adif_input_files()))
+        render_pipeline.close()
 
-    # Map
-    print("\n[Map]\n")
+        if len(render_summary.failed) > 0:
+            sys.exit(1)
+
+    else:
+        last_input_state = None
 
-    vis_map(all_qsos_ent, fp=f"{C_WORK_DATA_DIR}/output/qso_map.png", static_mode=True)
+        try:
+            while True:
+                try:
+                    # Size and mtime of all input files (appended records are ingested incrementally via the cache),
+                    # files removed or renamed while polling are skipped
+                    input_state = []
+                    for t_fp in sorted(get_adif_input_files()):
+                        try:
+                            t_stat = os.stat(C_WORK_DATA_DIR + "input/" + t_fp)
+                        except FileNotFoundError:
+                            continue
+                        input_state.append((t_fp, t_stat.st_size, t_stat.st_mtime_ns))
+
+                    if input_state != last_input_state:
+                        t_start = time.perf_counter()
+                        render(render_pipeline, load_qsos([x[0] for x in input_state]))
+
+                        # Only after a successful update (a failed one is retried at the next poll)
+                        last_input_state = input_state
+                        print(f"Updated in {time.perf_counter() - t_start:.1f} s, watching '{C_WORK_DATA_DIR}input/' "
+                              f"(Ctrl+C to stop)")
+
+                except Exception as e:
+                    print(f"WARN: Update failed: {e}")
 
-    vis_map(all_qsos_ent, fp_html=f"{C_WORK_DATA_DIR}/output/qso_map.html", static_mode=False)
+                time.sleep(args.interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            render_pipeline.close()
@@ -1,16 +1,22 @@
+import argparse
 from collections import Counter
 from datetime import datetime
+import json
 import os
+import sys
 from dataclasses import dataclass
 import matplotlib.pyplot as plt
-import adif_io
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from utils.LocationUtil import LocationUtil
-from typing import Optional
+from utils.LogbookUtil import LogbookUtil
+from utils.PdfUtil import PdfUtil
+from utils.QsoIndex import QsoIndex
+from utils.QsoTable import QsoTable
+from typing import Iterator, Optional
 
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import A4, portrait
 import pandas as pd
@@ -41,22 +47,6 @@ class QsoEntity:
     #     return f"Call: {self.call}, My Call: {self.my_call}, Time On: {self.time_utc_on}, Time Off: {self.time_utc_off}, Mode: {self.mode}, Sub Mode: {self.sub_mode}, My Locator: {self.my_locator}, Locator: {self.locator}, Freq: {self.freq}, QSL Sent: {self.qsl_sent} Country: {self.country}, RST Rcvd: {self.rst_rcvd}, Name: {self.name}, Calc Distance: {self.calc_distance}, Calc Duration: {self.calc_duration} "
 
 
-def get_all_qsos(input_paths):
-    print(f"Found {len(input_paths)} ADIF files: ")
-
-    ret_qsos = []
-
-    for t_fp in input_paths:
-        t_qsos, _ = adif_io.read_from_file(C_WORK_DATA_DIR + "input/" + t_fp)
-        print(f" - '{t_fp}' with {len(t_qsos)} QSOs")
-        for t_qso in t_qsos:
-            t_qso_with_source = t_qso
-            t_qso_with_source["_source_file"] = t_fp
-            ret_qsos.append(t_qso_with_source)
-
-    return ret_qsos
-
-
 def get_operator_from_filename(filename: str) -> str:
     p = os.path.splitext(os.path.basename(filename))[0].strip().upper()
     p = p.split("_")
@@ -66,95 +56,89 @@ def get_operator_from_filename(filename: str) -> str:
     return p
 
 
-def get_all_qsos_ent(input_qsos) -> [QsoEntity]:
+def get_all_qsos_ent(qsos: QsoTable) -> [QsoEntity]:
     ret_qsos: [QsoEntity] = []
 
-    for t_qso in input_qsos:
-
-        try:
-
-            # print(t_qso)
-            # raise Exception("Stop here")
-
-            calc_distance = None
-            if "gridsquare" in t_qso:
-                try:
-                    calc_distance = LocationUtil.calc_distance_azimuth(
-                        loc_0=LocationUtil.maidenhead_to_coordinates(t_qso["gridsquare"]),
-                        loc_1=LocationUtil.maidenhead_to_coordinates(t_qso["my_gridsquare"])
-                    )
-                    calc_distance = calc_distance.distance
-                    calc_distance = round(calc_distance, 2)
-                except Exception as e:
-                    print(f"- Warn by {str(t_qso).strip()}: {t_qso['gridsquare']}/{t_qso['call']}: {e}")
-
-            t_name = ""
-            if "name" in t_qso:
-                t_name = t_qso["name"]
-
-            rst_rcvd = ""
-            if "rst_rcvd" in t_qso:
-                rst_rcvd = t_qso["rst_rcvd"]
-
-            rst_sent = ""
-            if "rst_sent" in t_qso:
-                rst_sent = t_qso["rst_sent"]
-
-            l_qsl_sent_improved = False
-            if "qsl_sent" in t_qso:
-                l_qsl_sent_improved = t_qso["qsl_sent"] != "N"
-
-            l_country = ""
-            if "country" in t_qso:
-                l_country = t_qso["country"]
-
-            l_time_utc_on = ""
-            if "qso_date" in t_qso and "time_on" in t_qso:
-                l_time_utc_on = datetime.strptime(t_qso["qso_date"] + t_qso["time_on"], "%Y%m%d%H%M%S")
-
-            l_time_utc_off = ""
-            if "qso_date_off" in t_qso and "time_off" in t_qso:
-                l_time_utc_off = datetime.strptime(t_qso["qso_date_off"] + t_qso["time_off"], "%Y%m%d%H%M%S")
-            else:
-                l_time_utc_off = l_time_utc_on
-
-            l_calc_duration = 0
-            if l_time_utc_on != "" and l_time_utc_off != "":
-                if l_time_utc_on != l_time_utc_off:
-                    l_calc_duration = (l_time_utc_off - l_time_utc_on).total_seconds()
-
-            ret_qsos.append(QsoEntity(
-                call=t_qso["call"],
-                operator=get_operator_from_filename(t_qso["_source_file"]),
-                my_call=t_qso["station_callsign"],
-                time_utc_on=l_time_utc_on,
-                time_utc_off=l_time_utc_off,
-                mode=t_qso["mode"],
-                band=t_qso["band"],
-                sub_mode=t_qso["submode"] if "submode" in t_qso else None,
-                my_locator=t_qso["my_gridsquare"],
-                locator=t_qso["gridsquare"] if "gridsquare" in t_qso else None,
-                freq=round(float(t_qso["freq"]), 3),
-                qsl_sent_improved=l_qsl_sent_improved,
-                country=l_country,
-                rst_rcvd=rst_rcvd,
-                rst_sent=rst_sent,
-                name=t_name,
-                calc_distance=calc_distance,
-                calc_duration=l_calc_duration
-            ))
-
-        except Exception as e:
-            print(f"- Warn by {str(t_qso).strip()}: {e} [skipped]")
-
-    ret_qsos.sort(key=lambda x: x.time_utc_off)
+    df = qsos.df
+    # Missing values (NaN / NaT) as None, times as pd.Timestamp (datetime)
+    columns = {x: df[x].astype(object).where(df[x].notna(), None).tolist() for x in
+               ["call", "my_call", "time_utc_on", "time_utc_off", "mode", "band", "name", "sub_mode", "my_locator",
+                "locator", "freq", "qsl_sent", "country", "rst_rcvd", "rst_sent", "calc_distance", "calc_duration"]}
+    columns["operator"] = [get_operator_from_filename(x) for x in df["source_file"].astype(str)]
+    columns["qsl_sent_improved"] = columns.pop("qsl_sent")
+
+    for t_values in zip(*columns.values()):
+        ret_qsos.append(QsoEntity(**dict(zip(columns.keys(), t_values))))
 
     return ret_qsos
 
 
+def get_pdf_rows(qsos: [QsoEntity], verbose=True) -> Iterator[list]:
+    """Table rows of the logbook (formatted one QSO at a time)."""
+    for qso in qsos:
+        # Replace 0 to crossed 0 (zero)
+        call = qso.call.replace("0", "Ø")
+
+        if verbose:
+            print(
+                qso.operator,
+                call,
+                qso.mode,
+                qso.time_utc_off,
+                qso.sub_mode,
+                qso.band,
+                qso.name,
+                qso.freq,
+                qso.rst_sent,
+                qso.rst_rcvd,
+                qso.qsl_sent_improved
+            )
+
+        yield [
+            qso.operator,
+            call,
+            qso.time_utc_off.strftime("%d.%m.%Y %H:%M:%S"),
+            qso.mode,
+            qso.sub_mode,
+            qso.band,
+            f"{round(qso.freq, 3)}",
+            qso.rst_sent,
+            qso.rst_rcvd,
+            "yes" if qso.qsl_sent_improved else "no",
+            qso.name[:23],
+        ]
+
+
 if __name__ == "__main__":
     C_WORK_DATA_DIR = "workData/"
 
+    parser = argparse.ArgumentParser(description="ADIF Log to PDF")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Number of worker processes for parsing the ADIF files (default: 1)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Do not use the persistent logbook and location caches in the work data dir")
+    parser.add_argument("--since", default=None,
+                        help="Only QSOs with end at or after this time (UTC, e.g. 2024-06-01 or \"2024-06-01 12:00\")")
+    parser.add_argument("--until", default=None,
+                        help="Only QSOs with end before this time (UTC, e.g. 2024-06-03)")
+    parser.add_argument("--render-jobs", type=int, default=1,
+                        help="Number of worker processes for rendering ranges of the PDF pages (default: 1, the parts "
+                             "are merged with pypdf)")
+    parser.add_argument("--quiet", action="store_true",
+                        help="Do not print every QSO while the PDF is written (faster for large logs)")
+    # Resume point (without these the last printed QSO is asked for)
+    parser.add_argument("--last-call", default=None,
+                        help="Callsign of the last printed QSO, the PDF starts after it (non-interactive)")
+    parser.add_argument("--last-time", default=None,
+                        help="QSO end (UTC) of the last printed QSO, selects one of several QSOs of --last-call or "
+                             "alone starts the PDF after this time (non-interactive)")
+    parser.add_argument("--checkpoint", nargs="?", default=None, const=C_WORK_DATA_DIR + "outputPDF/checkpoint.json",
+                        help="Resume after the last printed QSO of this checkpoint file (all QSOs if it does not exist "
+                             "yet, --last-call / --last-time take precedence) and write the last printed QSO back "
+                             "after the PDF is built (non-interactive, default file: "
+                             "workData/outputPDF/checkpoint.json)")
+    args = parser.parse_args()
+
     print("########################################")
     print("[ADIF LOG TO PDF]")
     print("########################################")
@@ -169,12 +153,25 @@ if __name__ == "__main__":
                         f.endswith(".adi") or f.endswith(".adif")]
     assert len(adif_input_files) > 0, "Error: No ADIF files found in Input Dir"
 
-    all_qsos = get_all_qsos(adif_input_files)
+    print(f"Found {len(adif_input_files)} ADIF files: ")
+
+    # Same logbook cache as the analyzer
+    qsos = LogbookUtil.load_qsos(C_WORK_DATA_DIR + "input/", adif_input_files, jobs=args.jobs,
+                                 cache_dir=None if args.no_cache else C_WORK_DATA_DIR + "cache/")
     del adif_input_files
-    assert len(all_qsos) > 0, "Error: No QSOs found in all ADIF files"
+    assert len(qsos) > 0, "Error: No QSOs found in all ADIF files"
+
+    # Time window (slice of the sorted table by binary search)
+    if args.since is not None or args.until is not None:
+        num_all_qsos = len(qsos)
+        qsos = QsoIndex(qsos).window(args.since, args.until)
+        print(f"Window {args.since or '*'} - {args.until or '*'}: {len(qsos)} of {num_all_qsos} QSOs")
+        assert len(qsos) > 0, "Error: No QSOs found in the time window"
 
-    all_qsos_ent: [QsoEntity] = get_all_qsos_ent(all_qsos)
-    del all_qsos
+    # Entities in the order of the table (positions of the index)
+    qsos_index = QsoIndex(qsos)
+    all_qsos_ent: [QsoEntity] = get_all_qsos_ent(qsos)
+    del qsos
 
     # Output logbook overview
     print("\n[Logbook Overview]\n")
@@ -219,90 +216,69 @@ if __name__ == "__main__":
 
     # Collect Data Last n QSOs
 
-    # Enter last known Station Callsign
-    input_station = input("Enter last printed Station Callsign (leave empty for all): ")
-    # input_station = "DA6KIS"  # DA6KIS 05.05.2026 16:30:00
-    # input_station = ""
-    input_station = input_station.strip()
+    # Last printed QSO from the arguments, the checkpoint or entered
+    interactive = args.last_call is None and args.last_time is None and args.checkpoint is None
+    input_station = args.last_call
+    input_time = args.last_time
+
+    if interactive:
+        # Enter last known Station Callsign
+        input_station = input("Enter last printed Station Callsign (leave empty for all): ")
+        # input_station = "DA6KIS"  # DA6KIS 05.05.2026 16:30:00
+        # input_station = ""
+    elif input_station is None and input_time is None and os.path.exists(args.checkpoint):
+        with open(args.checkpoint, "r") as f:
+            checkpoint = json.load(f)
+        input_station, input_time = checkpoint["call"], checkpoint["time_utc_off"]
+        print(f"Checkpoint '{args.checkpoint}': last printed QSO {input_time} {input_station}")
+
+    input_station = (input_station or "").strip()
     input_station = input_station.upper()
 
-    # Search QSOs for Operator
+    # Search QSOs for Operator (callsign index, occurrences in order of time)
     if input_station != "":
-        all_qsos_ent_filter = [x for x in all_qsos_ent if x.call == input_station]
-
+        all_qsos_ent_filter = qsos_index.rows("call", input_station)
+        if input_time is not None:
+            all_qsos_ent_filter = np.intersect1d(all_qsos_ent_filter, qsos_index.at_time(input_time))
+            assert len(all_qsos_ent_filter) > 0, f"Error: No QSOs found for {input_station} at {input_time}"
         assert len(all_qsos_ent_filter) > 0, f"Error: No QSOs found for {input_station}"
 
-        if len(all_qsos_ent_filter) > 1:
+        all_qsos_ent_filter = [all_qsos_ent[i] for i in all_qsos_ent_filter]
+
+        if len(set(x.time_utc_off for x in all_qsos_ent_filter)) > 1:
+            assert interactive, (f"Error: Multiple QSOs found for {input_station}, select one with --last-time: "
+                                 f"{', '.join(str(x.time_utc_off) for x in all_qsos_ent_filter)}")
+
             print(f"Multiple QSOs found for {input_station}. Please select one:")
             for i, qso in enumerate(all_qsos_ent_filter):
                 print(f"{i}: {qso.time_utc_off}")
             input_idx = int(input("Enter Index: "))
             all_qsos_ent_filter = [all_qsos_ent_filter[input_idx]]
 
-        print("Last QSO for Operator:", all_qsos_ent_filter[0].time_utc_off, all_qsos_ent_filter[0].call)
+        print("Last QSO for Operator:", all_qsos_ent_filter[-1].time_utc_off, all_qsos_ent_filter[-1].call)
+        input_time = all_qsos_ent_filter[-1].time_utc_off
+
+    if input_time is not None:
+        # QSOs after this one (binary search in the time index)
+        all_qsos_ent = [all_qsos_ent[i] for i in qsos_index.time_range(since=input_time, include_since=False)]
 
-        # Get Date from next qso (in all_qsos_ent)
-        all_qsos_ent_filter = all_qsos_ent_filter[0]
-        all_qsos_ent_filter = [x for x in all_qsos_ent if x.time_utc_off > all_qsos_ent_filter.time_utc_off]
+    # Last printed QSO of this run (before the values are formatted)
+    last_qso = None
+    if len(all_qsos_ent) > 0:
+        last_qso = {"call": all_qsos_ent[-1].call, "time_utc_off": str(all_qsos_ent[-1].time_utc_off)}
+    print(f"QSOs to print: {len(all_qsos_ent)}")
 
-        # Filter Last to qso from this point
-        all_qsos_ent = [x for x in all_qsos_ent if x.time_utc_off >= all_qsos_ent_filter[0].time_utc_off]
+    # Nothing new since the resume point: keep the PDF of the last run (and the checkpoint)
+    if not interactive and len(all_qsos_ent) == 0:
+        print("Nothing to print, the PDF is not written")
+        sys.exit(0)
 
     # Reverse
     # all_qsos_ent = all_qsos_ent[::-1]
 
-    all_qsos_ent_prep = []
-
-    for qso in all_qsos_ent:
-        qso: QsoEntity = qso
-
-        # Replace 0 to crossed 0 (zero)
-        qso.call = qso.call.replace("0", "Ø")
-
-        print(
-            qso.operator,
-            qso.call,
-            qso.mode,
-            qso.time_utc_off,
-            qso.sub_mode,
-            qso.band,
-            qso.name,
-            qso.freq,
-            qso.rst_sent,
-            qso.rst_rcvd,
-            qso.qsl_sent_improved
-        )
-
-        qso.name = qso.name[:23]
-        qso.qsl_sent_improved = "yes" if qso.qsl_sent_improved else "no"
-        qso.time_utc_off = qso.time_utc_off.strftime("%d.%m.%Y %H:%M:%S")
-        qso.freq = f"{round(qso.freq, 3)}"
-
-        all_qsos_ent_prep.append(qso)
-
-    del all_qsos_ent
-
     # TO PDF
 
-    # Beispiel-Daten aus deiner Schleife
-    data = [
-        [
-            qso.operator,
-            qso.call,
-            qso.time_utc_off,
-            qso.mode,
-            qso.sub_mode,
-            qso.band,
-            qso.freq,
-            qso.rst_sent,
-            qso.rst_rcvd,
-            qso.qsl_sent_improved,
-            qso.name,
-        ]
-        for qso in all_qsos_ent_prep
-    ]
-
-    # Spaltenüberschriften hinzufügen
+    # Spaltenüberschriften
     columns = [
         "Operator",
         "Station",
@@ -316,25 +292,12 @@ if __name__ == "__main__":
         "QSL\nSent",
         "Name"
     ]
-    data.insert(0, columns)
-
-    # PDF erstellen
-    pdf_file = f"{C_WORK_DATA_DIR}outputPDF/logbook.pdf"
-    pdf = SimpleDocTemplate(pdf_file, pagesize=portrait(A4),
-
-                            topMargin=35,
-                            bottomMargin=35,
-
-                            # leftMargin=25,
-                            # rightMargin=25,
-                            )
 
     # Spaltenbreiten manuell festlegen (in Punkten)
     column_widths = [40, 70, 80, 40, 50, 30, 40, 20, 20, 20, 100]
 
-    table = Table(data, colWidths=column_widths, repeatRows=1)
-
-    style = TableStyle([
+    # Row 0 is the header on every page
+    style = [
         ('BACKGROUND', (0, 0), (-1, 0), colors.whitesmoke),
         ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
         ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
@@ -345,10 +308,28 @@ if __name__ == "__main__":
         ('BACKGROUND', (0, 1), (-1, -1), colors.white),
         ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
         ('WORDWRAP', (0, 0), (-1, -1), True)  # Textumbruch aktivieren
-    ])
-    table.setStyle(style)
+    ]
 
-    # PDF speichern
-    pdf.build([table])
+    # PDF erstellen (page by page, the rows are prepared while the pages are written)
+    pdf_file = f"{C_WORK_DATA_DIR}outputPDF/logbook.pdf"
+    pdf_layout = PdfUtil.TableLayout(columns=columns, column_widths=column_widths, style=style,
+                                     pagesize=portrait(A4), top_margin=35, bottom_margin=35, page_numbers=True)
+
+    if args.render_jobs > 1:
+        # Page ranges in worker processes
+        pdf_result = PdfUtil.write_table_parallel(pdf_file, pdf_layout,
+                                                  list(get_pdf_rows(all_qsos_ent, verbose=not args.quiet)),
+                                                  args.render_jobs)
+    else:
+        pdf_result = PdfUtil.write_table(pdf_file, pdf_layout, get_pdf_rows(all_qsos_ent, verbose=not args.quiet),
+                                         num_rows=len(all_qsos_ent))
 
     print(f"PDF '{pdf_file}' erfolgreich erstellt!")
+    print(f"{pdf_result.num_rows} rows on {pdf_result.num_pages} pages in {pdf_result.seconds:.1f} s "
+          f"({pdf_result.rows_per_second():.0f} rows/s)")
+
+    # Checkpoint for the next run (only after the PDF is built)
+    if args.checkpoint is not None and last_qso is not None:
+        with open(args.checkpoint, "w") as f:
+            json.dump(last_qso, f, indent=1)
+        print(f"Checkpoint '{args.checkpoint}': last printed QSO {last_qso['time_utc_off']} {last_qso['call']}")
@@ -0,0 +1,136 @@
+import mmap
+import os
+import re
+from typing import Iterable, Iterator, Optional, Tuple
+
+
+class AdifUtil:
+    # <NAME>, <NAME:LENGTH> or <NAME:LENGTH:TYPE>
+    _tag_re = re.compile(rb"<([A-Za-z0-9_]+)(?::(\d+)(?::[A-Za-z])?)?>")
+
+    @staticmethod
+    def iter_qsos(fp: str, fields: Optional[Iterable[str]] = None) -> Iterator[dict]:
+        """
+        Stream the QSO records of an ADIF file one at a time.
+
+        The file is memory-mapped and the length-prefixed fields are walked over the raw bytes. Only the values of
+        `fields` (lower case ADIF field names, all fields if None) are sliced and decoded, all other values are
+        skipped by their length. Keys are lower case ADIF field names, empty fields are dropped (as in adif_io).
+        """
+        for _, t_qso in AdifUtil.iter_qsos_with_offsets(fp, fields):
+            yield t_qso
+
+    @staticmethod
+    def iter_qsos_with_offsets(fp: str, fields: Optional[Iterable[str]] = None, start: int = 0) \
+            -> Iterator[Tuple[int, dict]]:
+        """
+        Like iter_qsos, but starts at byte offset `start` (0 or the end of a record) and yields every record together
+        with the byte offset after its <EOR> (to continue reading a growing file from there).
+        """
+        wanted = None
+        if fields is not None:
+            wanted = set(f.lower() for f in fields)
+
+        # Raw tag name -> record key ("" for skipped fields)
+        keys = {}
+
+        with open(fp, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                pos = start
+                t_qso = {}
+
+                for m in AdifUtil._tag_re.finditer(mm, start):
+                    # Tag inside a field value
+                    if m.start() < pos:
+                        continue
+
+                    name, length = m.groups()
+
+                    key = keys.get(name)
+                    if key is None:
+                        key = name.lower().decode()
+                        if wanted is not None and length is not None and key not in wanted:
+                            key = ""
+                        keys[name] = key
+
+                    # Tags without length (<EOR>, <EOH>)
+                    if length is None:
+                        if key == "eor":
+                            yield m.end(), t_qso
+                            t_qso = {}
+                        elif key == "eoh":
+                            # Drop header fields
+                            t_qso = {}
+                        pos = m.end()
+                        continue
+
+                    value_start = m.end()
+                    pos = value_start + int(length)
+
+                    if key == "" or pos == value_start:
+                        continue
+
+                    value = mm[value_start:pos]
+
+                    if not value.isascii():
+                        # ADIF lengths count characters, extend the slice by the UTF-8 continuation bytes
+                        missing = AdifUtil._num_continuation_bytes(value)
+                        while missing > 0:
+                            extra = mm[pos:pos + missing]
+                            if b"<" in extra:
+                                # Length was given in bytes
+                                break
+                            value += extra
+                            pos += len(extra)
+                            missing = AdifUtil._num_continuation_bytes(extra)
+
+                    t_qso[key] = value.decode("utf-8", errors="replace")
+
+    @staticmethod
+    def _num_continuation_bytes(b: bytes) -> int:
+        return sum(1 for x in b if 0x80 <= x < 0xC0)
+
+
+if __name__ == '__main__':
+    # Throughput comparison against adif_io
+    import sys
+    import time
+    import tracemalloc
+    import adif_io
+
+    C_BENCH_FIELDS = ["call", "station_callsign", "qso_date", "time_on", "qso_date_off", "time_off", "mode",
+                      "submode", "band", "freq", "gridsquare", "my_gridsquare", "name", "country", "qsl_sent",
+                      "rst_rcvd", "rst_sent"]
+    C_BENCH_ROUNDS = 5
+
+    input_fps = sys.argv[1:]
+    if len(input_fps) == 0:
+        input_dir = "workData/input/"
+        input_fps = [input_dir + f for f in sorted(os.listdir(input_dir)) if f.endswith(".adi") or f.endswith(".adif")]
+
+
+    def bench(name, fn, fp):
+        size_mb = os.path.getsize(fp) / 1024 / 1024
+
+        t_start = time.perf_counter()
+        for _ in range(C_BENCH_ROUNDS):
+            num_qsos = fn(fp)
+        t_run = (time.perf_counter() - t_start) / C_BENCH_ROUNDS
+
+        tracemalloc.start()
+        fn(fp)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        print(f" - {name:<24} {num_qsos:>7} QSOs {t_run * 1000:8.1f} ms {size_mb / t_run:7.1f} MB/s "
+              f"{num_qsos / t_run:10.0f} QSO/s  peak {peak / 1024:9.1f} KiB")
+
+
+    for t_fp in input_fps:
+        print(f"{t_fp} ({os.path.getsize(t_fp) / 1024:.1f} KiB)")
+        bench("adif_io.read_from_file", lambda fp: len(adif_io.read_from_file(fp)[0]), t_fp)
+        bench("AdifUtil (all fields)", lambda fp: sum(1 for _ in AdifUtil.iter_qsos(fp)), t_fp)
+        bench("AdifUtil (used fields)", lambda fp: sum(1 for _ in AdifUtil.iter_qsos(fp, C_BENCH_FIELDS)), t_fp)
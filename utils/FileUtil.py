@@ -0,0 +1,21 @@
+from contextlib import contextmanager
+import os
+
+
+class FileUtil:
+
+    @staticmethod
+    @contextmanager
+    def open_atomic(fp, mode="w"):
+        # Written to a temporary file that replaces `fp` on success: interrupted runs and concurrent writers never
+        # leave a partial file
+        os.makedirs(os.path.dirname(os.path.abspath(fp)), exist_ok=True)
+
+        tmp_fp = f"{fp}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_fp, mode) as f:
+                yield f
+            os.replace(tmp_fp, fp)
+        finally:
+            if os.path.exists(tmp_fp):
+                os.remove(tmp_fp)
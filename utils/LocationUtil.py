@@ -1,9 +1,27 @@
+from collections import OrderedDict
 from dataclasses import dataclass
+import functools
+import json
+import os
 import maidenhead as mh
+import numpy as np
 from pyproj import Geod
+from utils.FileUtil import FileUtil
 
 
 class LocationUtil:
+    C_CACHE_SIZE = 100000
+
+    # Shared geodesic (construction is expensive)
+    _geod = Geod(ellps="WGS84")
+
+    # (locator, my_locator) -> (distance, azimuth) or None for malformed locators, least recently used first
+    _distance_cache: OrderedDict = OrderedDict()
+    _cache_hits = 0
+    _cache_misses = 0
+    # Keys calculated since the last take_new_entries (e.g. in a worker process)
+    _new_keys: list = []
+
     @dataclass
     class Coordinate:
         latitude: float
@@ -14,24 +32,73 @@ class LocationUtil:
         distance: float
         azimuth: float
 
+    @dataclass
+    class CacheInfo:
+        hits: int
+        misses: int
+        size: int
+
+    @staticmethod
+    @functools.lru_cache(maxsize=C_CACHE_SIZE)
+    def _to_location(loc: str) -> (float, float):
+        return mh.to_location(loc)
+
     @staticmethod
     def maidenhead_to_coordinates(loc: str) -> Coordinate:
-        c = mh.to_location(loc)
+        c = LocationUtil._to_location(loc)
 
         return LocationUtil.Coordinate(
             latitude=c[0],
             longitude=c[1]
         )
 
+    # Latitude, longitude and validity mask (NaN and False instead of an exception for malformed locators)
+    @staticmethod
+    def maidenhead_to_coordinates_batch(locs) -> (np.ndarray, np.ndarray, np.ndarray):
+        locs = np.asarray(["" if x is None else x for x in locs], dtype=str)
+        n = len(locs)
+        if n == 0:
+            return np.empty(0), np.empty(0), np.empty(0, dtype=bool)
+
+        locs = np.char.upper(np.char.strip(locs))
+        lengths = np.char.str_len(locs)
+
+        # Fixed width ASCII codes (n x 8), non ASCII characters become "?"
+        codes = np.char.encode(locs, "ascii", "replace").astype("S8")
+        codes = np.frombuffer(codes.tobytes(), dtype=np.uint8).reshape(n, 8).astype(np.int64)
+
+        valid = (lengths >= 2) & (lengths <= 8) & (lengths % 2 == 0)
+        # Field A-R, square 0-9, subsquare A-X, extended square 0-9
+        for i, (c_min, c_max) in enumerate([("A", "R"), ("0", "9"), ("A", "X"), ("0", "9")]):
+            used = lengths > 2 * i
+            for c in (codes[:, 2 * i], codes[:, 2 * i + 1]):
+                valid &= ~used | ((c >= ord(c_min)) & (c <= ord(c_max)))
+
+        # Same operations as maidenhead.to_location (south-west corner)
+        lon = np.full(n, -180.0)
+        lat = np.full(n, -90.0)
+        lon += (codes[:, 0] - ord("A")) * 20
+        lat += (codes[:, 1] - ord("A")) * 10
+        lon += np.where(lengths >= 4, (codes[:, 2] - ord("0")) * 2, 0)
+        lat += np.where(lengths >= 4, (codes[:, 3] - ord("0")) * 1, 0)
+        lon += np.where(lengths >= 6, (codes[:, 4] - ord("A")) * 5.0 / 60, 0.0)
+        lat += np.where(lengths >= 6, (codes[:, 5] - ord("A")) * 2.5 / 60, 0.0)
+        lon += np.where(lengths >= 8, (codes[:, 6] - ord("0")) * 5.0 / 600, 0.0)
+        lat += np.where(lengths >= 8, (codes[:, 7] - ord("0")) * 2.5 / 600, 0.0)
+
+        lat[~valid] = np.nan
+        lon[~valid] = np.nan
+
+        return lat, lon, valid
+
     @staticmethod
     def coordinates_to_maidenhead(loc: Coordinate) -> str:
         return mh.to_maiden(loc.latitude, loc.longitude)
 
     @staticmethod
     def calc_distance_azimuth(loc_0: Coordinate, loc_1: Coordinate) -> DistanceAzimuth:
-        eod = Geod(ellps="WGS84")
-
-        azimuth0, azimuth1, distance = eod.inv(loc_0.longitude, loc_0.latitude, loc_1.longitude, loc_1.latitude)
+        azimuth0, azimuth1, distance = LocationUtil._geod.inv(loc_0.longitude, loc_0.latitude,
+                                                              loc_1.longitude, loc_1.latitude)
 
         azimuth0 = (azimuth0 + 360) % 360
         distance = distance / 1000
@@ -41,6 +108,122 @@ class LocationUtil:
             azimuth=azimuth0
         )
 
+    # Distance in km and azimuth 0..360 as arrays
+    @staticmethod
+    def calc_distance_azimuth_batch(lat_0, lon_0, lat_1, lon_1) -> DistanceAzimuth:
+        azimuth0, azimuth1, distance = LocationUtil._geod.inv(
+            np.asarray(lon_0, dtype=np.float64), np.asarray(lat_0, dtype=np.float64),
+            np.asarray(lon_1, dtype=np.float64), np.asarray(lat_1, dtype=np.float64)
+        )
+
+        return LocationUtil.DistanceAzimuth(
+            distance=distance / 1000,
+            azimuth=(azimuth0 + 360) % 360
+        )
+
+    # Paths on the sphere from (lat_0, lon_0) to every (lat_1, lon_1): latitudes and longitudes (paths x num_points)
+    @staticmethod
+    def great_circle_paths(lat_0, lon_0, lat_1, lon_1, num_points=32) -> (np.ndarray, np.ndarray):
+        def to_vectors(lat, lon):
+            lat, lon = np.radians(np.asarray(lat, dtype=np.float64)), np.radians(np.asarray(lon, dtype=np.float64))
+            return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+        v_1 = to_vectors(lat_1, lon_1).reshape(-1, 3)
+        v_0 = np.broadcast_to(to_vectors(lat_0, lon_0), v_1.shape)
+
+        omega = np.arccos(np.clip((v_0 * v_1).sum(axis=1), -1.0, 1.0))[:, None]
+        t = np.linspace(0.0, 1.0, num_points)[None, :]
+
+        # Weights of the start and end vector (linear for equal points)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            w_0 = np.where(omega > 1e-9, np.sin((1 - t) * omega) / np.sin(omega), 1 - t)
+            w_1 = np.where(omega > 1e-9, np.sin(t * omega) / np.sin(omega), t)
+
+        v = w_0[..., None] * v_0[:, None, :] + w_1[..., None] * v_1[:, None, :]
+
+        return (np.degrees(np.arctan2(v[..., 2], np.hypot(v[..., 0], v[..., 1]))),
+                np.degrees(np.arctan2(v[..., 1], v[..., 0])))
+
+    # Memoized by (locator, my_locator), only new distinct pairs are calculated (in one batch)
+    @staticmethod
+    def calc_distance_azimuth_locators(locs_0, locs_1) -> (DistanceAzimuth, np.ndarray):
+        cache = LocationUtil._distance_cache
+
+        keys = list(zip(locs_0, locs_1))
+        missing = list(dict.fromkeys(k for k in keys if k not in cache))
+
+        if len(missing) > 0:
+            lat_0, lon_0, valid_0 = LocationUtil.maidenhead_to_coordinates_batch([k[0] for k in missing])
+            lat_1, lon_1, valid_1 = LocationUtil.maidenhead_to_coordinates_batch([k[1] for k in missing])
+            da = LocationUtil.calc_distance_azimuth_batch(lat_0, lon_0, lat_1, lon_1)
+
+            for k, valid, distance, azimuth in zip(missing, valid_0 & valid_1, da.distance, da.azimuth):
+                cache[k] = (float(distance), float(azimuth)) if valid else None
+            LocationUtil._new_keys.extend(missing)
+
+        LocationUtil._cache_misses += len(missing)
+        LocationUtil._cache_hits += len(keys) - len(missing)
+
+        values = [cache[k] for k in keys]
+
+        for k in dict.fromkeys(keys):
+            cache.move_to_end(k)
+        while len(cache) > LocationUtil.C_CACHE_SIZE:
+            cache.popitem(last=False)
+
+        valid = np.array([v is not None for v in values], dtype=bool)
+
+        return LocationUtil.DistanceAzimuth(
+            distance=np.array([np.nan if v is None else v[0] for v in values], dtype=np.float64),
+            azimuth=np.array([np.nan if v is None else v[1] for v in values], dtype=np.float64)
+        ), valid
+
+    @staticmethod
+    def cache_info() -> CacheInfo:
+        return LocationUtil.CacheInfo(
+            hits=LocationUtil._cache_hits,
+            misses=LocationUtil._cache_misses,
+            size=len(LocationUtil._distance_cache)
+        )
+
+    # Entries calculated since the last call (of a worker process, see merge_cache)
+    @staticmethod
+    def take_new_entries() -> list:
+        cache = LocationUtil._distance_cache
+        ret = [(k, cache[k]) for k in dict.fromkeys(LocationUtil._new_keys) if k in cache]
+        LocationUtil._new_keys = []
+        return ret
+
+    @staticmethod
+    def merge_cache(entries: list, info: CacheInfo):
+        for k, v in entries:
+            LocationUtil._distance_cache[k] = v
+        while len(LocationUtil._distance_cache) > LocationUtil.C_CACHE_SIZE:
+            LocationUtil._distance_cache.popitem(last=False)
+
+        LocationUtil._cache_hits += info.hits
+        LocationUtil._cache_misses += info.misses
+
+    @staticmethod
+    def load_cache(fp: str):
+        if not os.path.exists(fp):
+            return
+
+        try:
+            with open(fp) as f:
+                entries = json.load(f)
+        except Exception as e:
+            print(f"WARN: Location cache '{fp}' not readable: {e}")
+            return
+
+        for (loc_0, loc_1), value in entries:
+            LocationUtil._distance_cache[(loc_0, loc_1)] = None if value is None else tuple(value)
+
+    @staticmethod
+    def save_cache(fp: str):
+        with FileUtil.open_atomic(fp, "w") as f:
+            json.dump([[list(k), v] for k, v in LocationUtil._distance_cache.items()], f)
+
 
 if __name__ == '__main__':
     # gps_0: LocationUtil.Coordinate = LocationUtil.maidenhead_to_coordinates("JN59NK18")
@@ -0,0 +1,350 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+import hashlib
+import os
+import pickle
+import sys
+from typing import Optional
+import numpy as np
+import pandas as pd
+from utils.AdifUtil import AdifUtil
+from utils.FileUtil import FileUtil
+from utils.LocationUtil import LocationUtil
+from utils.QsoTable import QsoTable
+from utils.TimeUtil import TimeUtil
+
+
+@dataclass(slots=True)
+class QsoEntity:
+    """
+    Compact QSO record: no per-instance __dict__, repeated strings are interned (see get_all_qsos_ent) and times are
+    UTC epoch seconds (see datetime_utc_on / datetime_utc_off for datetime objects).
+    """
+    call: str
+    my_call: str
+    time_utc_on: Optional[int]
+    time_utc_off: Optional[int]
+    mode: str
+    band: str
+    name: str
+    sub_mode: Optional[str]
+    my_locator: str
+    locator: Optional[str]
+    freq: float
+    qsl_sent: bool
+    country: str
+    rst_rcvd: str
+    rst_sent: str
+    calc_distance: Optional[float]
+    calc_duration: float
+
+    @property
+    def datetime_utc_on(self) -> Optional[datetime]:
+        return None if self.time_utc_on is None else datetime.fromtimestamp(self.time_utc_on, timezone.utc)
+
+    @property
+    def datetime_utc_off(self) -> Optional[datetime]:
+        return None if self.time_utc_off is None else datetime.fromtimestamp(self.time_utc_off, timezone.utc)
+
+
+class LogbookUtil:
+    # Bump if the enrichment or the cache format changes (invalidates the logbook cache)
+    C_CACHE_VERSION = 2
+
+    # ADIF fields consumed by get_all_qsos_ent (all other fields are skipped while parsing)
+    C_ADIF_FIELDS = ["call", "station_callsign", "qso_date", "time_on", "qso_date_off", "time_off", "mode", "submode",
+                     "band", "freq", "gridsquare", "my_gridsquare", "name", "country", "qsl_sent", "rst_rcvd",
+                     "rst_sent"]
+
+    @dataclass
+    class CachedLogbook:
+        table: QsoTable
+        # Byte offset after the last complete record of the table
+        offset: int
+        # File changed since (the records after offset have to be parsed)
+        modified: bool
+
+    @staticmethod
+    def get_all_qsos(input_dir, input_paths, offsets=None):
+        """
+        With `offsets` (input path -> byte offset) only the records after the offset are read and the offset is moved
+        behind the last complete record.
+        """
+        for t_fp in input_paths:
+            t_num_qsos = 0
+            t_start = 0 if offsets is None else offsets.get(t_fp, 0)
+            for t_offset, t_qso in AdifUtil.iter_qsos_with_offsets(input_dir + t_fp, LogbookUtil.C_ADIF_FIELDS,
+                                                                   t_start):
+                t_num_qsos += 1
+                if offsets is not None:
+                    offsets[t_fp] = t_offset
+                yield t_qso
+            if t_start > 0:
+                print(f" - '{t_fp}' with {t_num_qsos} new QSOs (after byte {t_start})")
+            else:
+                print(f" - '{t_fp}' with {t_num_qsos} QSOs")
+
+    @staticmethod
+    def get_all_qsos_ent(input_qsos) -> [QsoEntity]:
+        ret_qsos: [QsoEntity] = []
+
+        # QSOs with locator and their locators, distances are calculated in one batch after the loop
+        dist_qsos: [QsoEntity] = []
+        dist_locators = []
+
+        # Date and time fields of all QSOs, times are parsed in one batch after the loop
+        dates_on, times_on, dates_off, times_off = [], [], [], []
+
+        for t_qso in input_qsos:
+
+            try:
+
+                t_name = ""
+                if "name" in t_qso:
+                    t_name = t_qso["name"]
+
+                rst_rcvd = ""
+                if "rst_rcvd" in t_qso:
+                    rst_rcvd = t_qso["rst_rcvd"]
+
+                rst_sent = ""
+                if "rst_sent" in t_qso:
+                    rst_sent = t_qso["rst_sent"]
+
+                l_qsl_sent_improved = False
+                if "qsl_sent" in t_qso:
+                    l_qsl_sent_improved = t_qso["qsl_sent"] != "N"
+
+                l_country = ""
+                if "country" in t_qso:
+                    l_country = t_qso["country"]
+
+                # Repeated strings are interned (one shared object per distinct value)
+                ret_qsos.append(QsoEntity(
+                    call=sys.intern(t_qso["call"]),
+                    my_call=sys.intern(t_qso["station_callsign"]),
+                    time_utc_on=None,
+                    time_utc_off=None,
+                    mode=sys.intern(t_qso["mode"]),
+                    band=sys.intern(t_qso["band"]),
+                    sub_mode=sys.intern(t_qso["submode"]) if "submode" in t_qso else None,
+                    my_locator=sys.intern(t_qso["my_gridsquare"]),
+                    locator=sys.intern(t_qso["gridsquare"]) if "gridsquare" in t_qso else None,
+                    freq=round(float(t_qso["freq"]), 3),
+                    qsl_sent=l_qsl_sent_improved,
+                    country=sys.intern(l_country),
+                    rst_rcvd=sys.intern(rst_rcvd),
+                    rst_sent=sys.intern(rst_sent),
+                    name=t_name,
+                    calc_distance=None,
+                    calc_duration=0
+                ))
+
+                dates_on.append(t_qso.get("qso_date"))
+                times_on.append(t_qso.get("time_on"))
+                dates_off.append(t_qso.get("qso_date_off"))
+                times_off.append(t_qso.get("time_off"))
+
+                if "gridsquare" in t_qso:
+                    dist_qsos.append(ret_qsos[-1])
+                    dist_locators.append((t_qso["gridsquare"], t_qso["my_gridsquare"]))
+
+            except Exception as e:
+                print(f"- Warn by {str(t_qso).strip()}: {e} [skipped]")
+
+        if len(dist_qsos) > 0:
+            calc_distances, valid = LocationUtil.calc_distance_azimuth_locators(
+                [x[0] for x in dist_locators], [x[1] for x in dist_locators]
+            )
+
+            for t_qso, t_locators, t_valid, t_distance in zip(dist_qsos, dist_locators, valid,
+                                                               calc_distances.distance):
+                if t_valid:
+                    t_qso.calc_distance = round(float(t_distance), 2)
+                else:
+                    print(f"- Warn by {t_qso.call}: {t_locators[0]}/{t_locators[1]}: Invalid Maidenhead locator")
+
+        l_time_utc_on = TimeUtil.parse_adif_datetimes(dates_on, times_on)
+        l_time_utc_off = TimeUtil.parse_adif_datetimes(dates_off, times_off)
+        # Without QSO end the QSO start is used
+        l_time_utc_off = np.where(np.isnat(l_time_utc_off), l_time_utc_on, l_time_utc_off)
+        l_calc_duration = np.nan_to_num(TimeUtil.calc_durations(l_time_utc_on, l_time_utc_off), nan=0.0)
+        l_valid = ~np.isnat(l_time_utc_on)
+
+        for t_qso, t_time_utc_on, t_time_utc_off, t_calc_duration in zip(
+                ret_qsos, l_time_utc_on.astype(np.int64).tolist(), l_time_utc_off.astype(np.int64).tolist(),
+                l_calc_duration.tolist()):
+            t_qso.time_utc_on = t_time_utc_on
+            t_qso.time_utc_off = t_time_utc_off
+            t_qso.calc_duration = t_calc_duration
+
+        for t_qso in [x for x, v in zip(ret_qsos, l_valid) if not v]:
+            print(f"- Warn by {t_qso.call}: Missing or invalid QSO_DATE/TIME_ON [skipped]")
+        ret_qsos = [x for x, v in zip(ret_qsos, l_valid) if v]
+
+        ret_qsos.sort(key=lambda x: x.time_utc_off)
+
+        return ret_qsos
+
+    @staticmethod
+    def load_qsos_file(input_dir, input_path, offset=0) -> (QsoTable, int, list, LocationUtil.CacheInfo):
+        """
+        Parse and enrich the records of one ADIF file after byte `offset` into a table (with source_file column).
+        Also returns the byte offset after the last complete record and the location cache entries calculated and
+        the cache hits / misses of this file (to merge them into the cache of the parent process).
+        """
+        offsets = {input_path: offset}
+        LocationUtil.take_new_entries()
+        cache_info = LocationUtil.cache_info()
+
+        table = QsoTable.from_entities(
+            LogbookUtil.get_all_qsos_ent(LogbookUtil.get_all_qsos(input_dir, [input_path], offsets))
+        )
+        table.df["source_file"] = pd.Categorical([input_path] * len(table))
+
+        new_entries = LocationUtil.take_new_entries()
+        t_info = LocationUtil.cache_info()
+        cache_info = LocationUtil.CacheInfo(hits=t_info.hits - cache_info.hits,
+                                            misses=t_info.misses - cache_info.misses, size=len(new_entries))
+
+        return table, offsets[input_path], new_entries, cache_info
+
+    @staticmethod
+    def load_qsos(input_dir, input_paths, jobs=1, cache_dir=None) -> QsoTable:
+        """
+        Load the enriched QSOs of all ADIF files as one table sorted by time.
+
+        With `cache_dir` the table of every file is cached there together with the byte offset after its last
+        complete record and a hash of the file up to this offset. Unchanged files are not read at all, files with
+        unchanged prefix (e.g. a live log the logging software appends to) only from the offset, all other files are
+        parsed completely. With `jobs` > 1 the files are processed in worker processes (one file per worker).
+        """
+        location_cache_fp = None if cache_dir is None else cache_dir + "locations.json"
+
+        tables = {}
+        cached = {}
+        stats = {}
+
+        for t_fp in input_paths:
+            if cache_dir is None:
+                continue
+
+            # Before parsing (a file may change while it is parsed)
+            stats[t_fp] = os.stat(input_dir + t_fp)
+
+            cached[t_fp] = LogbookUtil._read_cache(input_dir + t_fp, LogbookUtil._get_cache_fp(cache_dir, t_fp))
+            if cached[t_fp] is not None and not cached[t_fp].modified:
+                tables[t_fp] = cached[t_fp].table
+                print(f" - '{t_fp}' with {len(tables[t_fp])} QSOs (cached)")
+
+        missing = [x for x in input_paths if x not in tables]
+        start_offsets = [cached[x].offset if cached.get(x) is not None else 0 for x in missing]
+        offsets = {}
+
+        if len(missing) > 0:
+            if location_cache_fp is not None:
+                LocationUtil.load_cache(location_cache_fp)
+
+            if jobs > 1 and len(missing) > 1:
+                # The workers start with the persistent location cache, their new entries are merged here
+                with ProcessPoolExecutor(max_workers=min(jobs, len(missing)),
+                                         initializer=LocationUtil.load_cache if location_cache_fp else None,
+                                         initargs=(location_cache_fp,) if location_cache_fp else ()) as executor:
+                    t_results = executor.map(LogbookUtil.load_qsos_file, [input_dir] * len(missing), missing,
+                                             start_offsets)
+                    for t_fp, (t_table, t_offset, t_entries, t_info) in zip(missing, t_results):
+                        tables[t_fp], offsets[t_fp] = t_table, t_offset
+                        LocationUtil.merge_cache(t_entries, t_info)
+            else:
+                for t_fp, t_start in zip(missing, start_offsets):
+                    tables[t_fp], offsets[t_fp] = LogbookUtil.load_qsos_file(input_dir, t_fp, t_start)[:2]
+
+            location_cache_info = LocationUtil.cache_info()
+            print(f"Location cache: {location_cache_info.hits} hits, {location_cache_info.misses} misses")
+
+            for t_fp in missing:
+                if cached.get(t_fp) is not None:
+                    # Merge the appended QSOs into the cached ones
+                    tables[t_fp] = QsoTable.concat([cached[t_fp].table, tables[t_fp]])
+
+            if cache_dir is not None:
+                LocationUtil.save_cache(location_cache_fp)
+
+                for t_fp in missing:
+                    # Changed while parsing, parse again next time
+                    if not LogbookUtil._same_stat(stats[t_fp], os.stat(input_dir + t_fp)):
+                        continue
+
+                    LogbookUtil._write_cache(
+                        LogbookUtil._get_cache_fp(cache_dir, t_fp),
+                        LogbookUtil._get_fingerprint(input_dir + t_fp, stats[t_fp], offsets[t_fp]),
+                        tables[t_fp]
+                    )
+
+        return QsoTable.concat([tables[x] for x in input_paths])
+
+    @staticmethod
+    def _get_cache_fp(cache_dir, input_path) -> str:
+        return cache_dir + "logbook/" + input_path + ".pkl"
+
+    @staticmethod
+    def _same_stat(stat_0: os.stat_result, stat_1: os.stat_result) -> bool:
+        return stat_0.st_size == stat_1.st_size and stat_0.st_mtime_ns == stat_1.st_mtime_ns
+
+    @staticmethod
+    def _get_prefix_sha1(fp, offset) -> str:
+        h = hashlib.sha1()
+        with open(fp, "rb") as f:
+            remaining = offset
+            while remaining > 0:
+                chunk = f.read(min(remaining, 1024 * 1024))
+                if len(chunk) == 0:
+                    break
+                h.update(chunk)
+                remaining -= len(chunk)
+        return h.hexdigest()
+
+    @staticmethod
+    def _get_fingerprint(fp, stat: os.stat_result, offset) -> dict:
+        return {
+            "version": LogbookUtil.C_CACHE_VERSION,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "offset": offset,
+            "sha1": LogbookUtil._get_prefix_sha1(fp, offset),
+        }
+
+    @staticmethod
+    def _read_cache(fp, cache_fp) -> Optional[CachedLogbook]:
+        """Returns the cached table of `fp` (None if not cached or the file changed before the cached offset)."""
+        if not os.path.exists(cache_fp):
+            return None
+
+        try:
+            with open(cache_fp, "rb") as f:
+                cached = pickle.load(f)
+        except Exception as e:
+            print(f"WARN: Logbook cache '{cache_fp}' not readable: {e}")
+            return None
+
+        cached_fp = cached["fingerprint"]
+        if cached_fp["version"] != LogbookUtil.C_CACHE_VERSION:
+            return None
+
+        # Unchanged size and mtime: no need to hash the content
+        stat = os.stat(fp)
+        if cached_fp["size"] == stat.st_size and cached_fp["mtime_ns"] == stat.st_mtime_ns:
+            return LogbookUtil.CachedLogbook(table=QsoTable(cached["df"]), offset=cached_fp["offset"], modified=False)
+
+        # Truncated or rewritten
+        if stat.st_size < cached_fp["offset"] or \
+                LogbookUtil._get_prefix_sha1(fp, cached_fp["offset"]) != cached_fp["sha1"]:
+            return None
+
+        return LogbookUtil.CachedLogbook(table=QsoTable(cached["df"]), offset=cached_fp["offset"], modified=True)
+
+    @staticmethod
+    def _write_cache(cache_fp, fingerprint, table: QsoTable):
+        with FileUtil.open_atomic(cache_fp, "wb") as f:
+            pickle.dump({"fingerprint": fingerprint, "df": table.df}, f, protocol=pickle.HIGHEST_PROTOCOL)
@@ -0,0 +1,29 @@
+import os
+from typing import Optional
+import numpy as np
+
+
+# Offline world map: country outlines (Natural Earth 1:110m, see utils/data/README.md) and web mercator projection
+class MapUtil:
+
+    C_WORLD_FP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "world_110m.npz")
+
+    # Latitudes are clipped to this (web mercator is infinite at the poles)
+    C_MAX_LATITUDE = 85.0
+
+    # Polygon rings (n x 2 arrays of longitude, latitude), loaded on first use
+    _outlines: Optional[list] = None
+
+    @staticmethod
+    def get_outlines() -> [np.ndarray]:
+        if MapUtil._outlines is None:
+            with np.load(MapUtil.C_WORLD_FP) as data:
+                coords = data["coords"].astype(np.float64) / 100
+                MapUtil._outlines = np.split(coords, data["ring_starts"][1:])
+        return MapUtil._outlines
+
+    @staticmethod
+    def project(lat, lon) -> (np.ndarray, np.ndarray):
+        # x / y in degrees of longitude at the equator
+        lat = np.clip(np.asarray(lat, dtype=np.float64), -MapUtil.C_MAX_LATITUDE, MapUtil.C_MAX_LATITUDE)
+        return np.asarray(lon, dtype=np.float64), np.degrees(np.log(np.tan(np.pi / 4 + np.radians(lat) / 2)))
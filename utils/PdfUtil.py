@@ -0,0 +1,172 @@
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import chain, islice
+import math
+import os
+import tempfile
+import time
+from typing import Iterable, Optional
+from reportlab.lib.pagesizes import A4, portrait
+from reportlab.lib.units import inch
+from reportlab.pdfgen.canvas import Canvas
+from reportlab.platypus import Frame, Table, TableStyle
+
+# Optional, only to merge the parts of write_table_parallel
+try:
+    from pypdf import PdfWriter
+except ImportError:
+    PdfWriter = None
+
+
+class PdfUtil:
+    """
+    Table documents written page by page.
+
+    Rows have a fixed height (one line per cell), so the number of rows per page is measured once and every page is
+    one small table of that many rows (with the header row) drawn directly on the canvas. Only the rows of the current
+    page are in memory and the layout time is linear in the number of rows (instead of one table of all rows that is
+    laid out and split by the document template).
+
+    As pages are independent, write_table_parallel renders page aligned ranges of the rows in worker processes and
+    merges the parts (needs pypdf).
+    """
+
+    @dataclass
+    class TableLayout:
+        # Header row (repeated on every page)
+        columns: list
+        column_widths: list
+        # TableStyle commands, row 0 is the header on every page
+        style: list
+        pagesize: tuple = portrait(A4)
+        # Margins (as of SimpleDocTemplate), the frame has a padding of 6 points
+        top_margin: float = inch
+        bottom_margin: float = inch
+        left_margin: float = inch
+        right_margin: float = inch
+        # Footer "Page n / m" (or "Page n" if the number of pages is not known)
+        page_numbers: bool = False
+
+    @dataclass
+    class Result:
+        num_rows: int = 0
+        num_pages: int = 0
+        seconds: float = 0.0
+
+        def rows_per_second(self) -> float:
+            return self.num_rows / self.seconds if self.seconds > 0 else 0.0
+
+    @staticmethod
+    def write_table(fp, layout: TableLayout, rows: Iterable[list], num_rows: Optional[int] = None, first_page=1,
+                    rows_per_page: Optional[int] = None) -> Result:
+        """
+        Write `rows` (consumed lazily) as table pages to the PDF `fp` (one page with the header if no rows).
+
+        `num_rows` is the number of rows of the whole document (for the number of pages in the footer), `first_page`
+        and `rows_per_page` are given for the parts of a document.
+        """
+        result = PdfUtil.Result()
+        t_start = time.perf_counter()
+
+        rows = iter(rows)
+        first_row = next(rows, None)
+        if first_row is not None:
+            if rows_per_page is None:
+                rows_per_page = PdfUtil.get_rows_per_page(layout, first_row)
+            rows = chain([first_row], rows)
+        rows_per_page = rows_per_page or 1
+
+        num_pages = None if num_rows is None else max(1, math.ceil(num_rows / rows_per_page))
+
+        canvas = Canvas(fp, pagesize=layout.pagesize)
+
+        while True:
+            t_rows = list(islice(rows, rows_per_page))
+            if len(t_rows) == 0 and result.num_pages > 0:
+                break
+
+            PdfUtil._draw_page(canvas, layout, t_rows, first_page + result.num_pages, num_pages)
+            result.num_rows += len(t_rows)
+            result.num_pages += 1
+
+        canvas.save()
+
+        result.seconds = time.perf_counter() - t_start
+        return result
+
+    @staticmethod
+    def write_table_parallel(fp, layout: TableLayout, rows: list, jobs: int) -> Result:
+        """
+        Like write_table, but `jobs` worker processes render page aligned ranges of `rows` to partial PDFs that are
+        merged to `fp` (in one process if pypdf is not installed).
+        """
+        if jobs <= 1 or len(rows) == 0 or PdfWriter is None:
+            if jobs > 1 and PdfWriter is None:
+                print("WARN: pypdf not installed (pip install pypdf), writing the PDF in one process")
+            return PdfUtil.write_table(fp, layout, rows, num_rows=len(rows))
+
+        t_start = time.perf_counter()
+
+        rows_per_page = PdfUtil.get_rows_per_page(layout, rows[0])
+        num_pages = math.ceil(len(rows) / rows_per_page)
+        pages_per_part = math.ceil(num_pages / jobs)
+
+        # Parts (first row, last row, first page number)
+        parts = [(x * rows_per_page, min(len(rows), (x + pages_per_part) * rows_per_page), x + 1)
+                 for x in range(0, num_pages, pages_per_part)]
+
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(fp))) as tmp_dir:
+            part_fps = [os.path.join(tmp_dir, f"part_{i}.pdf") for i in range(len(parts))]
+
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                part_results = [executor.submit(PdfUtil.write_table, t_fp, layout, rows[t_lo:t_hi], len(rows),
+                                                t_first_page, rows_per_page)
+                                for t_fp, (t_lo, t_hi, t_first_page) in zip(part_fps, parts)]
+                part_results = [x.result() for x in part_results]
+
+            writer = PdfWriter()
+            for t_fp in part_fps:
+                writer.append(t_fp)
+            with open(fp, "wb") as f:
+                writer.write(f)
+
+        return PdfUtil.Result(
+            num_rows=sum(x.num_rows for x in part_results),
+            num_pages=sum(x.num_pages for x in part_results),
+            seconds=time.perf_counter() - t_start,
+        )
+
+    @staticmethod
+    def get_rows_per_page(layout: TableLayout, sample_row: list) -> int:
+        width, height = PdfUtil._get_frame_size(layout)
+        # Available height in the frame
+        height -= 12
+
+        header_height = Table([layout.columns], colWidths=layout.column_widths,
+                              style=TableStyle(layout.style)).wrap(width, height)[1]
+        row_height = Table([layout.columns, sample_row], colWidths=layout.column_widths,
+                           style=TableStyle(layout.style)).wrap(width, height)[1] - header_height
+
+        return max(1, int((height - header_height + 1e-6) // row_height))
+
+    @staticmethod
+    def _draw_page(canvas: Canvas, layout: TableLayout, rows: list, page: int, num_pages: Optional[int]):
+        width, height = PdfUtil._get_frame_size(layout)
+        frame = Frame(layout.left_margin, layout.bottom_margin, width, height)
+
+        flowables = [Table([layout.columns] + rows, colWidths=layout.column_widths, style=TableStyle(layout.style))]
+        frame.addFromList(flowables, canvas)
+        if len(flowables) > 0:
+            raise ValueError(f"Rows of page {page} do not fit on the page (more than one line?)")
+
+        if layout.page_numbers:
+            canvas.setFont("Helvetica", 7)
+            canvas.drawCentredString(layout.pagesize[0] / 2, layout.bottom_margin / 2,
+                                     f"Page {page}" if num_pages is None else f"Page {page} / {num_pages}")
+
+        canvas.showPage()
+
+    @staticmethod
+    def _get_frame_size(layout: TableLayout) -> (float, float):
+        return (layout.pagesize[0] - layout.left_margin - layout.right_margin,
+                layout.pagesize[1] - layout.top_margin - layout.bottom_margin)
@@ -0,0 +1,221 @@
+import re
+from typing import Optional, Union
+import numpy as np
+import pandas as pd
+from utils.QsoTable import QsoTable
+
+
+class QsoIndex:
+    """
+    Indexes over a QsoTable for filter queries without full scans.
+
+    Hash indexes (value -> row positions) on the columns C_INDEX_COLUMNS, a prefix trie on the callsigns and a sorted
+    time index (epoch nanoseconds of the QSO end) for time ranges by binary search. Regular expressions are only
+    matched against the distinct callsigns. Indexes are built on first use. Row positions are sorted ascending (by
+    time, as the table).
+
+    A query is a dict of filters that all have to match (see C_FILTERS), a filter value may be a list of values of
+    which one has to match (e.g. {"prefix": ["DL", "DK"], "band": "20m"}). A list of queries matches the QSOs of any
+    of them. Values are case-insensitive (as in ADIF), the index keys are upper case.
+    """
+
+    C_INDEX_COLUMNS = ["call", "country", "band", "mode"]
+
+    # Filter -> description
+    C_FILTERS = {
+        "call": "Callsign",
+        "prefix": "Callsign prefix",
+        "regex": "Regular expression searched in the callsign",
+        "country": "Country (ADIF country name)",
+        "band": "Band (e.g. 20m)",
+        "mode": "Mode (e.g. FT8)",
+        "since": "QSO end at or after this time (e.g. 2024-06-01 or 2024-06-01 12:00)",
+        "until": "QSO end before this time",
+    }
+
+    def __init__(self, qsos: QsoTable):
+        self.qsos = qsos
+
+        # Column -> value -> row positions
+        self._index = {}
+        # Prefix trie of the callsigns: char -> node, key "" holds the callsign ending at the node
+        self._trie: Optional[dict] = None
+        # Sorted epoch nanoseconds of the QSO ends (without missing times) and their row positions (None if the
+        # table is sorted by time without missing times, then the positions are the indices of the times)
+        self._times: Optional[np.ndarray] = None
+        self._time_rows: Optional[np.ndarray] = None
+
+    def rows(self, column, values) -> np.ndarray:
+        """Row positions with one of `values` in `column` (hash index lookup)."""
+        index = self._get_index(column)
+        keys = [str(x).upper() for x in QsoIndex._as_list(values)]
+        return QsoIndex._union([index[x] for x in keys if x in index])
+
+    def time_range(self, since=None, until=None, include_since=True) -> np.ndarray:
+        """
+        Row positions of the QSOs with end in [since, until) (e.g. "2024-06-01", pd.Timestamp, None for open), by
+        binary search in the time index. With `include_since` False QSOs at `since` are excluded.
+        """
+        lo, hi = self._get_time_bounds(since, until, include_since)
+        return np.arange(lo, hi) if self._time_rows is None else np.sort(self._time_rows[lo:hi])
+
+    def at_time(self, time) -> np.ndarray:
+        """Row positions of the QSOs with end at `time` (binary search in the time index)."""
+        times = self._get_times()
+        t_time = QsoIndex._to_epoch_ns(time)
+        lo, hi = np.searchsorted(times, t_time, side="left"), np.searchsorted(times, t_time, side="right")
+        return np.arange(lo, hi) if self._time_rows is None else np.sort(self._time_rows[lo:hi])
+
+    def window(self, since=None, until=None) -> QsoTable:
+        """QSOs with end in [since, until) (a slice of the table if it is sorted by time)."""
+        lo, hi = self._get_time_bounds(since, until)
+        rows = slice(lo, hi) if self._time_rows is None else np.sort(self._time_rows[lo:hi])
+        return QsoTable(self.qsos.df.iloc[rows].reset_index(drop=True))
+
+    def calls_with_prefix(self, prefix) -> [str]:
+        t_node = self._get_trie()
+        for t_char in prefix.upper():
+            t_node = t_node.get(t_char)
+            if t_node is None:
+                return []
+
+        ret = []
+        t_stack = [t_node]
+        while len(t_stack) > 0:
+            t_node = t_stack.pop()
+            for t_char, t_child in t_node.items():
+                if t_char == "":
+                    ret.append(t_child)
+                else:
+                    t_stack.append(t_child)
+        return ret
+
+    def calls_matching(self, pattern) -> [str]:
+        t_re = re.compile(pattern, re.IGNORECASE)
+        return [x for x in self._get_index("call") if t_re.search(x)]
+
+    def query(self, query: Union[dict, list]) -> np.ndarray:
+        """Row positions of the QSOs matching `query` (see class doc)."""
+        if isinstance(query, list):
+            return QsoIndex._union([self.query(x) for x in query])
+
+        ret: Optional[np.ndarray] = None
+
+        for t_filter, t_values in query.items():
+            if t_filter in ["country", "band", "mode", "call"]:
+                t_rows = self.rows(t_filter, t_values)
+            elif t_filter == "prefix":
+                t_rows = self.rows("call", [y for x in QsoIndex._as_list(t_values) for y in self.calls_with_prefix(x)])
+            elif t_filter == "regex":
+                t_rows = self.rows("call", [y for x in QsoIndex._as_list(t_values) for y in self.calls_matching(x)])
+            elif t_filter == "since":
+                t_rows = self.time_range(since=t_values)
+            elif t_filter == "until":
+                t_rows = self.time_range(until=t_values)
+            else:
+                raise ValueError(f"Unknown filter '{t_filter}' (known: {', '.join(QsoIndex.C_FILTERS)})")
+
+            ret = t_rows if ret is None else np.intersect1d(ret, t_rows, assume_unique=True)
+
+        return np.arange(len(self.qsos)) if ret is None else ret
+
+    def select(self, query: Union[dict, list]) -> QsoTable:
+        return QsoTable(self.qsos.df.iloc[self.query(query)].reset_index(drop=True))
+
+    @staticmethod
+    def check_query(query: Union[dict, list]):
+        """Raises ValueError if `query` is no dict of known filters or list of them (e.g. of a query file)."""
+        for t_query in QsoIndex._as_list(query):
+            if not isinstance(t_query, dict):
+                raise ValueError(f"Invalid query {t_query!r} (expected a dict of filters or a list of them)")
+            for t_filter in t_query:
+                if t_filter not in QsoIndex.C_FILTERS:
+                    raise ValueError(f"Unknown filter '{t_filter}' (known: {', '.join(QsoIndex.C_FILTERS)})")
+
+    @staticmethod
+    def parse_filters(filters: [str]) -> dict:
+        """Query of "filter=value[,value...]" strings (e.g. from the command line)."""
+        ret = {}
+        for t_filter in filters:
+            t_name, sep, t_values = t_filter.partition("=")
+            if sep == "" or t_name.strip() not in QsoIndex.C_FILTERS:
+                raise ValueError(f"Invalid filter '{t_filter}' (expected filter=value, filters: "
+                                 f"{', '.join(QsoIndex.C_FILTERS)})")
+            t_values = [x.strip() for x in t_values.split(",")]
+            # since / until are single values
+            ret[t_name.strip()] = t_values if t_name.strip() not in ["since", "until"] else t_values[0]
+        return ret
+
+    def _get_index(self, column) -> dict:
+        if column not in self._index:
+            self._index[column] = QsoIndex._build_hash_index(self.qsos.df[column])
+        return self._index[column]
+
+    def _get_trie(self) -> dict:
+        if self._trie is None:
+            self._trie = {}
+            for t_call in self._get_index("call"):
+                t_node = self._trie
+                for t_char in t_call:
+                    t_node = t_node.setdefault(t_char, {})
+                t_node[""] = t_call
+        return self._trie
+
+    def _get_times(self) -> np.ndarray:
+        if self._times is None:
+            times = self.qsos.df["time_utc_off"].values.astype("datetime64[ns]", copy=False).view(np.int64)
+            is_valid = times != np.iinfo(np.int64).min
+
+            if is_valid.all() and (len(times) < 2 or (times[1:] >= times[:-1]).all()):
+                self._times = times
+            else:
+                self._time_rows = np.flatnonzero(is_valid)
+                self._time_rows = self._time_rows[np.argsort(times[self._time_rows], kind="stable")]
+                self._times = times[self._time_rows]
+        return self._times
+
+    def _get_time_bounds(self, since=None, until=None, include_since=True) -> (int, int):
+        """Range [lo, hi) of the time index."""
+        times = self._get_times()
+
+        lo = 0 if since is None else int(np.searchsorted(times, QsoIndex._to_epoch_ns(since),
+                                                         side="left" if include_since else "right"))
+        hi = len(times) if until is None else int(np.searchsorted(times, QsoIndex._to_epoch_ns(until), side="left"))
+
+        return lo, max(lo, hi)
+
+    @staticmethod
+    def _to_epoch_ns(value) -> int:
+        t_time = pd.Timestamp(value)
+        # Times without zone are UTC
+        if t_time.tzinfo is not None:
+            t_time = t_time.tz_convert(None)
+        return t_time.value
+
+    @staticmethod
+    def _build_hash_index(values: pd.Series) -> dict:
+        categorical = values.astype("category").cat
+
+        # Upper case keys, categories that only differ in case share a key
+        key_codes, keys = pd.factorize(pd.Index(categorical.categories.astype(str)).str.upper())
+        # Missing values (-1) stay -1
+        codes = np.append(key_codes, -1)[categorical.codes.values]
+
+        # Row positions grouped by key (stable, ascending per group), missing values (-1) first
+        order = np.argsort(codes, kind="stable")
+        counts = np.bincount(codes[codes >= 0], minlength=len(keys))
+        groups = np.split(order[len(codes) - counts.sum():], np.cumsum(counts)[:-1])
+
+        return {x: y for x, y in zip(keys, groups) if len(y) > 0}
+
+    @staticmethod
+    def _union(rows: [np.ndarray]) -> np.ndarray:
+        if len(rows) == 0:
+            return np.zeros(0, dtype=np.int64)
+        if len(rows) == 1:
+            return rows[0]
+        return np.unique(np.concatenate(rows))
+
+    @staticmethod
+    def _as_list(values) -> list:
+        return values if isinstance(values, list) else [values]
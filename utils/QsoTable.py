@@ -0,0 +1,83 @@
+from dataclasses import fields
+import pandas as pd
+
+
+class QsoTable:
+    """
+    Columnar in-memory QSO store.
+
+    One typed pandas column per QSO attribute: repeated strings are categoricals, times are datetime64 (built from
+    UTC epoch seconds, NaT if missing) and numbers are float64 (NaN if missing). Rows are in the order of the input
+    (sorted by time).
+    """
+
+    C_CATEGORY_COLUMNS = ["call", "my_call", "mode", "sub_mode", "band", "my_locator", "locator", "country",
+                          "rst_rcvd", "rst_sent", "source_file"]
+    C_TIME_COLUMNS = ["time_utc_on", "time_utc_off"]
+    C_FLOAT_COLUMNS = ["freq", "calc_distance", "calc_duration"]
+    C_BOOL_COLUMNS = ["qsl_sent"]
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    @staticmethod
+    def from_entities(items: list) -> "QsoTable":
+        if len(items) == 0:
+            return QsoTable.from_columns({})
+
+        return QsoTable.from_columns(
+            {f.name: [getattr(x, f.name) for x in items] for f in fields(items[0])}
+        )
+
+    @staticmethod
+    def from_columns(columns: dict) -> "QsoTable":
+        df = pd.DataFrame(index=pd.RangeIndex(len(next(iter(columns.values()), []))))
+
+        for name, values in columns.items():
+            if name in QsoTable.C_CATEGORY_COLUMNS:
+                values = pd.Series(values, dtype=object)
+                # Categories in order of first appearance (keeps the order of ties in counts)
+                df[name] = pd.Categorical(values, categories=values.dropna().unique())
+            elif name in QsoTable.C_TIME_COLUMNS:
+                # UTC epoch seconds
+                df[name] = pd.to_datetime(pd.Series(values, dtype="float64"), unit="s")
+            elif name in QsoTable.C_FLOAT_COLUMNS:
+                df[name] = pd.Series(values, dtype=object).astype("float64")
+            elif name in QsoTable.C_BOOL_COLUMNS:
+                df[name] = pd.Series(values, dtype=bool)
+            else:
+                df[name] = pd.Series(values, dtype=object)
+
+        return QsoTable(df)
+
+    @staticmethod
+    def concat(tables: list) -> "QsoTable":
+        """Concatenate tables and sort them by time_utc_off (stable, ties in order of the tables)."""
+        dfs = [x.df for x in tables if len(x) > 0]
+        if len(dfs) == 0:
+            return QsoTable(pd.DataFrame())
+
+        # Same dtypes in all tables (pandas no longer excludes all-NA columns from the result dtype, e.g. a tail
+        # batch without SUBMODE): categoricals as objects (rebuilt below), all-NA columns as in the other tables
+        dtypes = {}
+        for t_df in dfs:
+            for name in t_df.columns:
+                if name not in dtypes and t_df[name].notna().any():
+                    dtypes[name] = t_df[name].dtype
+        dfs = [x.astype({name: object if name in QsoTable.C_CATEGORY_COLUMNS else dtypes.get(name, x[name].dtype)
+                         for name in x.columns if name in QsoTable.C_CATEGORY_COLUMNS or x[name].isna().all()})
+               for x in dfs]
+
+        df = pd.concat(dfs, ignore_index=True)
+        df = df.sort_values("time_utc_off", kind="stable", ignore_index=True)
+
+        # Categories of the merged columns in order of first appearance again
+        for name in QsoTable.C_CATEGORY_COLUMNS:
+            if name in df.columns:
+                values = df[name].astype(object)
+                df[name] = pd.Categorical(values, categories=values.dropna().unique())
+
+        return QsoTable(df)
@@ -0,0 +1,228 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from functools import partial
+import hashlib
+import json
+import os
+import time
+from typing import Any, Callable, Optional
+import pandas as pd
+from utils.FileUtil import FileUtil
+from utils.QsoTable import QsoTable
+
+
+class RenderPipeline:
+    """
+    Declared outputs: aggregate -> figure -> file.
+
+    Aggregates are functions of inputs or other aggregates, computed once per run (also if shared by several outputs).
+    Every output is rendered from one aggregate by a render function `render(data, fp)`. The content hash of the
+    aggregate (and the renderer) is kept in a manifest per output file with the size and mtime of the file written, and
+    the output is only rendered again if the hash differs or the file is missing or was written since (e.g. by a run
+    without the manifest). With `manifest_fp` the manifest is
+    persisted, otherwise it only lives as long as the pipeline (e.g. in watch mode).
+
+    Outputs are independent once their aggregates are computed: with `jobs` > 1 the renderers (which must be
+    picklable, e.g. module-level functions or partials of them) run in worker processes, slowest outputs first.
+    """
+
+    # Bump if the hashing or the manifest format changes (invalidates the manifest)
+    C_MANIFEST_VERSION = 3
+
+    @dataclass
+    class Output:
+        fp: str
+        aggregate: str
+        render: Callable[[Any, str], None]
+
+    @dataclass
+    class Summary:
+        rebuilt: list = field(default_factory=list)
+        reused: list = field(default_factory=list)
+        skipped: list = field(default_factory=list)
+        failed: list = field(default_factory=list)
+        # Wall time of the run and sum of the render times of the rebuilt outputs
+        seconds: float = 0.0
+        render_seconds: float = 0.0
+
+    def __init__(self, manifest_fp: Optional[str] = None, version="", jobs=1):
+        self.manifest_fp = manifest_fp
+        # Salt of all hashes, change if the renderers change
+        self.version = version
+        # Number of worker processes for rendering (outputs are rendered concurrently, the workers are kept until
+        # close, e.g. across the runs of watch mode)
+        self.jobs = jobs
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+        self._aggregates = {}
+        self._outputs: [RenderPipeline.Output] = []
+
+        self._manifest = {}
+        if manifest_fp is not None and os.path.exists(manifest_fp):
+            try:
+                with open(manifest_fp, "r") as f:
+                    manifest = json.load(f)
+                if manifest["version"] == RenderPipeline.C_MANIFEST_VERSION:
+                    self._manifest = manifest["outputs"]
+            except Exception as e:
+                print(f"WARN: Render manifest '{manifest_fp}' not readable: {e}")
+
+    def add_aggregate(self, name, fn: Callable, depends: [str]):
+        """Aggregate `name` = fn(*values of `depends`), a value None means nothing to render."""
+        self._aggregates[name] = (fn, depends)
+
+    def add_output(self, fp, aggregate, render: Callable[[Any, str], None]):
+        self._outputs.append(RenderPipeline.Output(fp=fp, aggregate=aggregate, render=render))
+
+    def run(self, inputs: dict) -> Summary:
+        """Render all outputs whose aggregate changed, `inputs` are the values of the root names (e.g. the QSOs)."""
+        values = dict(inputs)
+        hashes = {}
+        summary = RenderPipeline.Summary()
+        t_start = time.perf_counter()
+
+        def get_value(name):
+            if name not in values:
+                fn, depends = self._aggregates[name]
+                values[name] = fn(*[get_value(x) for x in depends])
+            return values[name]
+
+        # Output -> status, outputs to render with their data and hash
+        status = {}
+        pending = []
+
+        for t_output in self._outputs:
+            try:
+                t_data = get_value(t_output.aggregate)
+
+                if t_data is None:
+                    status[t_output.fp] = "skipped"
+                    continue
+
+                if t_output.aggregate not in hashes:
+                    hashes[t_output.aggregate] = RenderPipeline.hash_data(t_data)
+                t_hash = RenderPipeline._hash_str(
+                    self.version + RenderPipeline._get_render_key(t_output.render) + hashes[t_output.aggregate]
+                )
+
+                t_entry = self._manifest.get(t_output.fp, {})
+                t_stat = RenderPipeline._get_file_stat(t_output.fp)
+                if t_entry.get("hash") == t_hash and t_stat is not None and t_entry.get("stat") == t_stat:
+                    status[t_output.fp] = "reused"
+                    continue
+
+                pending.append((t_output, t_data, t_hash))
+
+            except Exception as e:
+                print(f"WARN: Output '{os.path.basename(t_output.fp)}' failed: {e}")
+                status[t_output.fp] = "failed"
+
+        # Slowest outputs (by their last render time) first
+        pending.sort(key=lambda x: -self._manifest.get(x[0].fp, {}).get("seconds", 0.0))
+
+        if self.jobs > 1 and len(pending) > 0:
+            # Always in the workers (no plotly / kaleido state in this process that would be shared by forking)
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.jobs)
+            t_results = [self._executor.submit(RenderPipeline._render, x[0].render, x[1], x[0].fp) for x in pending]
+        else:
+            t_results = None
+
+        for i, (t_output, t_data, t_hash) in enumerate(pending):
+            try:
+                if t_results is not None:
+                    t_seconds = t_results[i].result()
+                else:
+                    t_seconds = RenderPipeline._render(t_output.render, t_data, t_output.fp)
+
+                self._manifest[t_output.fp] = {"hash": t_hash, "seconds": round(t_seconds, 3),
+                                               "stat": RenderPipeline._get_file_stat(t_output.fp)}
+                summary.render_seconds += t_seconds
+                status[t_output.fp] = "rebuilt"
+
+            except Exception as e:
+                print(f"WARN: Output '{os.path.basename(t_output.fp)}' failed: {e}")
+                self._manifest.pop(t_output.fp, None)
+                status[t_output.fp] = "failed"
+
+                # Worker died, start new workers in the next run
+                if isinstance(e, BrokenProcessPool):
+                    self.close()
+
+        # In order of the declaration
+        for t_output in self._outputs:
+            getattr(summary, status[t_output.fp]).append(os.path.basename(t_output.fp))
+        summary.seconds = time.perf_counter() - t_start
+
+        if self.manifest_fp is not None:
+            with FileUtil.open_atomic(self.manifest_fp, "w") as f:
+                json.dump({"version": RenderPipeline.C_MANIFEST_VERSION, "outputs": self._manifest}, f, indent=1)
+
+        return summary
+
+    def close(self):
+        """Stop the render workers (started by run with `jobs` > 1)."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    @staticmethod
+    def _render(render, data, fp) -> float:
+        t_start = time.perf_counter()
+        render(data, fp)
+        return time.perf_counter() - t_start
+
+    @staticmethod
+    def _get_file_stat(fp) -> Optional[list]:
+        """Size and mtime (ns) of a file, None if missing."""
+        try:
+            t_stat = os.stat(fp)
+        except OSError:
+            return None
+        return [t_stat.st_size, t_stat.st_mtime_ns]
+
+    @staticmethod
+    def print_summary(summary: Summary):
+        print(f"Rebuilt {len(summary.rebuilt)}, reused {len(summary.reused)}, skipped {len(summary.skipped)}, "
+              f"failed {len(summary.failed)} outputs in {summary.seconds:.1f} s "
+              f"(render time of the rebuilt outputs {summary.render_seconds:.1f} s)")
+        for t_label, t_names in [("Rebuilt", summary.rebuilt), ("Reused", summary.reused),
+                                 ("Skipped (no data)", summary.skipped), ("Failed", summary.failed)]:
+            if len(t_names) > 0:
+                print(f" - {t_label}: {', '.join(t_names)}")
+
+    @staticmethod
+    def hash_data(data) -> str:
+        """Content hash of an aggregate (pandas objects, QsoTable, strings, numbers and tuples/lists of them)."""
+        h = hashlib.sha1()
+        RenderPipeline._update_hash(h, data)
+        return h.hexdigest()
+
+    @staticmethod
+    def _update_hash(h, data):
+        if isinstance(data, QsoTable):
+            data = data.df
+
+        if isinstance(data, pd.DataFrame):
+            h.update(repr(("df", list(data.columns), [str(x) for x in data.dtypes])).encode())
+            h.update(pd.util.hash_pandas_object(data, index=True).values.tobytes())
+        elif isinstance(data, pd.Series):
+            h.update(repr(("series", data.name, str(data.dtype))).encode())
+            h.update(pd.util.hash_pandas_object(data, index=True).values.tobytes())
+        elif isinstance(data, (tuple, list)):
+            h.update(f"seq{len(data)}".encode())
+            for x in data:
+                RenderPipeline._update_hash(h, x)
+        else:
+            h.update(repr((type(data).__name__, data)).encode())
+
+    @staticmethod
+    def _get_render_key(render) -> str:
+        if isinstance(render, partial):
+            return repr((RenderPipeline._get_render_key(render.func), render.args, sorted(render.keywords.items())))
+        return f"{render.__module__}.{render.__qualname__}"
+
+    @staticmethod
+    def _hash_str(s: str) -> str:
+        return hashlib.sha1(s.encode()).hexdigest()
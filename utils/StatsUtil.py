@@ -0,0 +1,130 @@
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from utils.QsoTable import QsoTable
+
+
+class StatsUtil:
+    # Columns with counts per value in QsoStats.counts
+    C_COUNT_COLUMNS = ["mode", "sub_mode", "band", "call", "locator", "country", "my_locator", "my_call"]
+
+    @dataclass
+    class QsoStats:
+        num_total_qsos: int
+        num_send_qsl: int
+        num_calc_distance: int
+        first_qso: pd.Timestamp
+        last_qso: pd.Timestamp
+        # Column -> counts per value (missing values dropped, descending, ties in order of first appearance)
+        counts: dict
+        # Counts by time of QSO end (only bins with QSOs): per date (datetime.date), month (1-12), weekday
+        # (0 = Monday) and hour (0-23), sorted by bin
+        per_date: pd.Series
+        per_month: pd.Series
+        per_weekday: pd.Series
+        per_hour: pd.Series
+
+        def num_distinct(self, column) -> int:
+            return len(self.counts[column])
+
+    @staticmethod
+    def aggregate(qsos: QsoTable) -> QsoStats:
+        """
+        All overview counters, value counts and time histograms of the QSOs in one vectorized pass per column.
+
+        The counts per value are one bincount over the codes of the categorical column, the time histograms one
+        bincount over (day, hour) of the QSO end from which dates, months, weekdays and hours are summed up.
+        """
+        df = qsos.df
+
+        counts = {x: StatsUtil._count_values(df[x]) for x in StatsUtil.C_COUNT_COLUMNS}
+
+        # Seconds since epoch of the QSO end
+        secs = df["time_utc_off"].dropna().values.astype("datetime64[s]").astype(np.int64)
+        days = secs // 86400
+        hours = secs % 86400 // 3600
+
+        if len(secs) > 0:
+            first_day = days.min()
+            day_hour = np.bincount((days - first_day) * 24 + hours).astype(np.int64)
+            day_hour = np.pad(day_hour, (0, -len(day_hour) % 24)).reshape(-1, 24)
+        else:
+            first_day = 0
+            day_hour = np.zeros((0, 24), dtype=np.int64)
+
+        per_day = day_hour.sum(axis=1)
+        per_hour = day_hour.sum(axis=0)
+
+        day_numbers = first_day + np.arange(len(per_day))
+        day_dates = day_numbers.astype("datetime64[D]")
+        months = day_dates.astype("datetime64[M]").astype(np.int64) % 12 + 1
+        # 1970-01-01 was a Thursday
+        weekdays = (day_numbers + 3) % 7
+
+        per_month = np.bincount(months, weights=per_day, minlength=13).astype(np.int64)
+        per_weekday = np.bincount(weekdays, weights=per_day, minlength=7).astype(np.int64)
+
+        has_qsos = per_day > 0
+
+        return StatsUtil.QsoStats(
+            num_total_qsos=len(df),
+            num_send_qsl=int(df["qsl_sent"].sum()),
+            num_calc_distance=int(df["calc_distance"].notna().sum()),
+            first_qso=df["time_utc_off"].iloc[0],
+            last_qso=df["time_utc_off"].iloc[-1],
+            counts=counts,
+            per_date=pd.Series(per_day[has_qsos], index=day_dates[has_qsos].astype(object)),
+            per_month=StatsUtil._non_zero(per_month),
+            per_weekday=StatsUtil._non_zero(per_weekday),
+            per_hour=StatsUtil._non_zero(per_hour),
+        )
+
+    @staticmethod
+    def calls(qsos: QsoTable) -> pd.DataFrame:
+        """
+        Calls of the QSOs (one vectorized group-by) with name of the first QSO, time of the last QSO and number of
+        QSOs, sorted by time of the last QSO (ties in order of the categories).
+        """
+        ret = qsos.df.groupby("call", observed=True).agg(
+            name=("name", "first"),
+            last_qso=("time_utc_off", "max"),
+            num_qsos=("time_utc_off", "size"),
+        )
+        return ret.sort_values("last_qso", kind="stable")
+
+    @staticmethod
+    def bin_values(values: np.ndarray, max_bins: int) -> (np.ndarray, np.ndarray, float):
+        """
+        Histogram with at most about `max_bins` bins of a "nice" size (1, 2 or 5 times a power of ten).
+
+        Returns the bin starts, the counts per bin and the bin size.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return np.zeros(0), np.zeros(0, dtype=np.int64), 1.0
+
+        raw_size = (values.max() - values.min()) / max_bins
+        size = 1.0
+        if raw_size > 0:
+            magnitude = 10 ** np.floor(np.log10(raw_size))
+            size = next(x * magnitude for x in (1, 2, 5, 10) if x * magnitude >= raw_size)
+
+        first_start = np.floor(values.min() / size) * size
+        counts = np.bincount(np.floor((values - first_start) / size).astype(np.int64))
+
+        return first_start + np.arange(len(counts)) * size, counts, float(size)
+
+    @staticmethod
+    def _count_values(values: pd.Series) -> pd.Series:
+        categorical = values.astype("category").cat
+        codes = categorical.codes.values
+        ret = pd.Series(np.bincount(codes[codes >= 0], minlength=len(categorical.categories)),
+                        index=categorical.categories)
+        ret = ret[ret > 0]
+        return ret.sort_values(ascending=False, kind="stable")
+
+    @staticmethod
+    def _non_zero(counts: np.ndarray) -> pd.Series:
+        idx = np.flatnonzero(counts)
+        return pd.Series(counts[idx], index=idx)
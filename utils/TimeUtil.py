@@ -0,0 +1,63 @@
+import numpy as np
+
+
+class TimeUtil:
+
+    @staticmethod
+    def parse_adif_datetimes(dates, times) -> np.ndarray:
+        """
+        Vectorized parsing of ADIF date (YYYYMMDD) and time (HHMMSS or HHMM) columns, e.g. QSO_DATE and TIME_ON.
+
+        Returns UTC datetime64[s] values with NaT as missing value marker (missing or malformed date or time).
+        """
+        dates = np.asarray(["" if x is None else x for x in dates], dtype=str)
+        times = np.asarray(["" if x is None else x for x in times], dtype=str)
+
+        ret = np.full(len(dates), np.datetime64("NaT"), dtype="datetime64[s]")
+        if len(dates) == 0:
+            return ret
+
+        # HHMM -> HHMM00
+        times = np.where(np.char.str_len(times) == 4, np.char.add(times, "00"), times)
+
+        valid = (np.char.str_len(dates) == 8) & (np.char.str_len(times) == 6)
+        idx = np.flatnonzero(valid)
+        if len(idx) == 0:
+            return ret
+
+        # Digits of YYYYMMDDHHMMSS as (n x 14) matrix, non ASCII characters become "?"
+        d = np.char.encode(np.char.add(dates[idx], times[idx]), "ascii", "replace").astype("S14")
+        d = np.frombuffer(d.tobytes(), dtype=np.uint8).reshape(-1, 14).astype(np.int64) - ord("0")
+
+        year = d[:, 0] * 1000 + d[:, 1] * 100 + d[:, 2] * 10 + d[:, 3]
+        month = d[:, 4] * 10 + d[:, 5]
+        day = d[:, 6] * 10 + d[:, 7]
+        hour = d[:, 8] * 10 + d[:, 9]
+        minute = d[:, 10] * 10 + d[:, 11]
+        second = d[:, 12] * 10 + d[:, 13]
+
+        months = ((year - 1970) * 12 + (month - 1)).astype("datetime64[M]")
+        days = months.astype("datetime64[D]") + (day - 1)
+
+        ok = ((d >= 0) & (d <= 9)).all(axis=1)
+        ok &= (month >= 1) & (month <= 12) & (day >= 1) & (hour < 24) & (minute < 60) & (second < 60)
+        # Day within month
+        ok &= days.astype("datetime64[M]") == months
+
+        ret[idx[ok]] = (days.astype("datetime64[s]") + (hour * 3600 + minute * 60 + second))[ok]
+
+        return ret
+
+    @staticmethod
+    def calc_durations(time_on: np.ndarray, time_off: np.ndarray) -> np.ndarray:
+        """Vectorized time_off - time_on in seconds (NaN where a time is missing)."""
+        return (time_off - time_on) / np.timedelta64(1, "s")
+
+
+if __name__ == '__main__':
+    on = TimeUtil.parse_adif_datetimes(["20240328", "20240328", "20240230", None], ["164500", "1645", "120000", "1200"])
+    off = TimeUtil.parse_adif_datetimes(["20240328", "20240328", "20240301", "20240301"], ["164726", "1646", "1200", ""])
+
+    print(on)
+    print(off)
+    print(TimeUtil.calc_durations(on, off))